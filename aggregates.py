@@ -0,0 +1,27 @@
+from data_index import goal_numbers
+
+
+class DashboardAggregates:
+    """Tables shown by the main page tabs, computed once per data version.
+
+    The frames are shared by every session, so callers must treat them (and
+    df_long) as read-only.
+    """
+
+    def __init__(self, df_long):
+        goals = goal_numbers(df_long['Indicator Number'])
+
+        # Number of rows for each goal, largest first as value_counts orders them
+        counts = goals.value_counts()
+        self.goal_counts = counts.rename_axis('Goal').reset_index(name='Count')
+        self.goal_counts['Goal'] = 'Goal ' + self.goal_counts['Goal'].astype(str)
+        self.goal_counts['Percentage'] = (self.goal_counts['Count'] / self.goal_counts['Count'].sum()) * 100
+
+        self.yearly_summary = df_long.groupby('Year').agg({'Value': 'mean'}).reset_index()
+
+        progress = (df_long['Value'] / df_long['Target Value']) * 100
+        achieved = progress >= 100
+        self.target_achievers = df_long[achieved].assign(
+            Goal='Goal ' + goals[achieved].astype(str),
+            Progress=progress[achieved],
+        )
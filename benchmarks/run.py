@@ -0,0 +1,225 @@
+"""Benchmark the load, filter, aggregate, trendline and report paths on a synthetic workbook.
+
+Usage: python benchmarks/run.py [--indicators N] [--sub-categories M] [--years Y]
+                                [--output results.json] [--baseline baseline.json] [--threshold 0.25]
+
+Runs headless with no network: the cache directory and cover image are local
+temporaries. Exits with status 1 when a case regresses against the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(fn, repeat, setup=None):
+    """Best and median wall time over `repeat` runs, then peak traced memory of one more run."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    # tracemalloc slows the code down, so memory is measured on a separate run.
+    # Allocations made in worker processes are not included.
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(timings), 'median_seconds': statistics.median(timings), 'peak_bytes': peak}
+
+
+def interactions(df_long, count):
+    """Filter selections a user might make, cycling through the data."""
+    indicators = df_long['Indicator'].unique()
+    sub_categories = df_long['Sub Category'].dropna().unique()
+    departments = df_long['Department'].dropna().unique()
+    return [(indicators[i % len(indicators)], sub_categories[i % len(sub_categories)],
+             departments[i % len(departments)], i % 17 + 1) for i in range(count)]
+
+
+def run_cases(args, workbook, work_dir):
+    # Imported here so SDG_CACHE_DIR and SDG_COVER_IMAGE are already set
+    import data_loader
+    from aggregates import DashboardAggregates
+    from chart_renderer import render_charts
+    from data_index import DataIndex
+    from docx_generator import create_docx_report, generate_docx_report, get_cover_image
+    from forecasts import forecast_targets
+    from plots import generate_trendline_plot
+    from targets import evaluate_targets
+    from trendlines import fit_trendlines
+
+    results = {}
+
+    def case(name, fn, repeat=args.repeat, setup=None):
+        print(f"{name:<22}", end='', flush=True)
+        results[name] = measure(fn, repeat, setup)
+        print(f"{results[name]['seconds'] * 1000:10.1f} ms  {results[name]['peak_bytes'] / 2 ** 20:8.1f} MiB")
+
+    def forget_loaded():
+        data_loader._loaded.clear()
+
+    def forget_store():
+        forget_loaded()
+        shutil.rmtree(os.path.join(data_loader.CACHE_DIR, 'data'), ignore_errors=True)
+
+    load = lambda: data_loader.load_data(workbook)
+    case('load_excel', load, repeat=1, setup=forget_store)
+    case('load_store', load, setup=forget_loaded)
+    case('load_memo', load)
+
+    df_long, indicators = data_loader.load_data(workbook)
+    selections = interactions(df_long, args.interactions)
+
+    def filter_scan():
+        # The full boolean scans the pages used before DataIndex
+        for indicator, sub_category, department, goal in selections:
+            indicator_df = df_long[(df_long['Indicator'] == indicator) & (df_long['Year'].between(2015, 2021))]
+            for value in indicator_df['Sub Category'].unique():
+                indicator_df[indicator_df['Sub Category'] == value]
+            df_long[df_long['Sub Category'] == sub_category]
+            df_long[df_long['Department'] == department]
+            goal_df = df_long[df_long['Indicator Number'].astype(str).str.startswith(f'{goal}.')]
+            goal_df[goal_df['Indicator'] == indicator]
+
+    index = DataIndex(df_long)
+
+    def filter_index():
+        # The same lookups as filter_scan, through DataIndex
+        for indicator, sub_category, department, goal in selections:
+            indicator_df = index.rows('Indicator', indicator)
+            indicator_df = indicator_df[indicator_df['Year'].between(2015, 2021)]
+            index.rows('Sub Category', sub_category)
+            index.rows('Department', department)
+            index.rows('Goal', goal)
+            index.select({'Goal': goal, 'Indicator': indicator})
+
+    case('index_build', lambda: DataIndex(df_long))
+    case('filter_scan', filter_scan)
+    case('filter_index', filter_index)
+
+    def targets_selected():
+        # Target evaluation of the selected indicators, timed apart from the lookups
+        for indicator, _, _, _ in selections:
+            indicator_df = index.rows('Indicator', indicator)
+            evaluate_targets(indicator_df[indicator_df['Year'].between(2015, 2021)])
+
+    case('targets_selected', targets_selected)
+    case('aggregates', lambda: DashboardAggregates(df_long))
+    case('targets_all', lambda: evaluate_targets(df_long, group_cols=['Indicator', 'Sub Category']))
+    case('trendline_fit_all', lambda: fit_trendlines(df_long, group_col='Indicator'))
+    case('forecast_all', lambda: forecast_targets(df_long))
+
+    def trendline_plots():
+        for indicator, _, _, _ in selections:
+            generate_trendline_plot(index.rows('Indicator', indicator))
+
+    case('trendline_plots', trendline_plots)
+
+    if args.skip_report:
+        return results
+
+    get_cover_image()
+    spool_dir = os.path.join(work_dir, 'spool')
+    os.makedirs(spool_dir, exist_ok=True)
+    images = {}
+
+    def render():
+        images.update(render_charts(df_long, indicators, max_workers=args.workers, spool_dir=spool_dir))
+
+    report_path = os.path.join(work_dir, 'report.docx')
+    case('render_charts', render, repeat=1)
+    case('create_docx_report', lambda: create_docx_report(images, get_cover_image(), output=report_path), repeat=1)
+    case('generate_docx_report', lambda: generate_docx_report(df_long, indicators, max_workers=args.workers,
+                                                              use_cache=False, output=report_path), repeat=1)
+    results['generate_docx_report']['report_bytes'] = os.path.getsize(report_path)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names of the cases that got slower or used more memory than baseline by more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {previous[metric]:.4g} -> {result[metric]:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--indicators', type=int, default=500)
+    parser.add_argument('--sub-categories', type=int, default=3)
+    parser.add_argument('--years', type=int, default=7)
+    parser.add_argument('--interactions', type=int, default=50, help='filter selections per filter case')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--skip-report', action='store_true', help='skip the chart rendering and DOCX cases')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, e.g. 0.25 for 25%%')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='sdg-bench-')
+    try:
+        os.environ['SDG_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        cover_path = os.path.join(work_dir, 'cover.png')
+        from PIL import Image
+        Image.new('RGB', (600, 800), 'white').save(cover_path)
+        os.environ['SDG_COVER_IMAGE'] = cover_path
+
+        from benchmarks.synthetic import write_workbook
+        from data_loader import LAST_YEAR
+        workbook = write_workbook(os.path.join(work_dir, 'synthetic.xlsx'), indicators=args.indicators,
+                                  sub_categories=args.sub_categories, years=args.years, last_year=LAST_YEAR)
+        results = run_cases(args, workbook, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'params': {'indicators': args.indicators, 'sub_categories': args.sub_categories, 'years': args.years,
+                   'interactions': args.interactions, 'workers': args.workers},
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        # ru_maxrss is in KiB on Linux
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != report['params']:
+            print("Warning: the baseline was recorded with different parameters", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
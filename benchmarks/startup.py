@@ -0,0 +1,39 @@
+"""Measure how long the app's modules take to import, each in a fresh interpreter.
+
+Usage: python benchmarks/startup.py [--repeat N] [module ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['data_loader', 'plots', 'chart_renderer', 'docx_generator']
+
+SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_time(module):
+    result = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module)],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        timings = [import_time(module) for _ in range(args.repeat)]
+        print(f"{module:<20} median {statistics.median(timings) * 1000:8.1f} ms   "
+              f"max {max(timings) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Generate a synthetic workbook with the shape of allgoals.xlsx.
+
+Usage: python benchmarks/synthetic.py out.xlsx [--indicators N] [--sub-categories M] [--years Y]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+GOALS = 17
+
+
+def synthetic_frame(indicators=500, sub_categories=3, years=7, last_year=2021, departments=40, seed=0):
+    """Wide frame with `indicators` indicators spread over the 17 goals, each with
+    `sub_categories` rows and `years` year columns ending at last_year."""
+    rng = np.random.default_rng(seed)
+    rows = indicators * sub_categories
+    indicator_ids = np.repeat(np.arange(indicators), sub_categories)
+    goals = indicator_ids % GOALS + 1
+    numbers = [f'{goal}.{i // GOALS + 1}.1' for goal, i in zip(goals, indicator_ids)]
+
+    df = pd.DataFrame({
+        'Sl No.': np.arange(1, rows + 1),
+        'Indicator Number': numbers,
+        'Indicator': [f'Synthetic indicator {i}' for i in indicator_ids],
+        'Sub Category': [f'Sub category {i % sub_categories}' for i in range(rows)],
+    })
+    base = rng.uniform(0, 100, rows)
+    trend = rng.normal(0, 2, rows)
+    for offset, year in enumerate(range(last_year - years + 1, last_year + 1)):
+        values = base + trend * offset + rng.normal(0, 1, rows)
+        # A few gaps, like the real workbook
+        values[rng.random(rows) < 0.05] = np.nan
+        df[str(year)] = values.round(2)
+    df['Target Year'] = 2030
+    df['Target Value'] = (base + rng.normal(10, 5, rows)).round(2)
+    df['Department'] = [f'Department {i % departments}' for i in indicator_ids]
+    return df
+
+
+def write_workbook(path, **kwargs):
+    synthetic_frame(**kwargs).to_excel(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    parser.add_argument('--indicators', type=int, default=500)
+    parser.add_argument('--sub-categories', type=int, default=3)
+    parser.add_argument('--years', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_workbook(args.output, indicators=args.indicators, sub_categories=args.sub_categories,
+                   years=args.years, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from data_loader import CACHE_DIR
+
+CHART_CACHE_DIR = os.path.join(CACHE_DIR, 'charts')
+
+
+def chart_key(indicator, indicator_number, indicator_df, params):
+    """Content hash of an indicator's data slice plus the rendering parameters."""
+    sha = hashlib.sha256()
+    sha.update(repr((str(indicator), str(indicator_number), sorted(params.items()))).encode())
+    sha.update(repr(list(indicator_df.columns)).encode())
+    sha.update(pd.util.hash_pandas_object(indicator_df, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+class ChartCache:
+    """Rendered chart images: a byte-bounded in-memory LRU in front of an on-disk store."""
+
+    def __init__(self, directory=CHART_CACHE_DIR, max_memory_bytes=64 << 20, max_disk_bytes=1 << 30):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.img')
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        self._remember(key, data)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write chart cache entry {path}: {e}")
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def prune_disk(self):
+        """Delete the least recently written disk entries until the store fits max_disk_bytes."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+# Shared by every report build in this process. Keys are content hashes, so a
+# changed indicator simply misses and unchanged ones keep hitting; entries of
+# old data versions are never hit again and age out of the LRU and prune_disk.
+shared_cache = ChartCache()
@@ -0,0 +1,214 @@
+import io
+import multiprocessing
+import os
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from chart_cache import chart_key
+from instrumentation import current_tracer, span
+
+# Only these columns are shipped to the worker processes
+PLOT_COLUMNS = ['Year', 'Value', 'Sub Category', 'Target Value']
+
+# Part of every chart cache key; change it whenever the chart styling changes
+RENDER_PARAMS = {'style': 2}
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """Size and encoding of the chart images."""
+    width: float = 6  # inches; the picture slot in the report is 6x4
+    height: float = 4
+    dpi: int = 150
+    format: str = 'png'  # 'png' or 'jpeg' (Word cannot embed WebP)
+    colors: int = 0  # quantize PNGs to this many palette colors; 0 keeps full RGBA
+    quality: int = 85  # JPEG quality
+
+
+RENDER_PROFILES = {
+    # What the report used to embed: a 20x10 inch figure downscaled into the slot
+    'legacy': RenderProfile(width=20, height=10, dpi=100),
+    'print': RenderProfile(dpi=200),
+    'compact': RenderProfile(dpi=150, colors=64),
+    'jpeg': RenderProfile(dpi=150, format='jpeg'),
+}
+DEFAULT_PROFILE = 'compact'
+
+
+def _encode(fig, canvas, profile):
+    img_buffer = io.BytesIO()
+    if profile.format == 'png' and not profile.colors:
+        fig.savefig(img_buffer, format='png', dpi=profile.dpi)
+        return img_buffer.getvalue()
+
+    canvas.draw()
+    image = Image.fromarray(np.asarray(canvas.buffer_rgba())).convert('RGB')
+    if profile.format == 'jpeg':
+        image.save(img_buffer, format='JPEG', quality=profile.quality, optimize=True)
+    elif profile.format == 'png':
+        # Charts use a handful of flat colors, so a small palette is visually lossless
+        image.quantize(colors=profile.colors).save(img_buffer, format='PNG', optimize=True)
+    else:
+        raise ValueError(f"Unsupported chart format: {profile.format!r}")
+    return img_buffer.getvalue()
+
+
+def render_indicator_chart(indicator, indicator_number, indicator_df, profile=RENDER_PROFILES[DEFAULT_PROFILE]):
+    """Render one indicator's chart to image bytes with the object-oriented Agg API (no pyplot state)."""
+    fig = Figure(figsize=(profile.width, profile.height), dpi=profile.dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    for sub_category, sub_category_df in indicator_df.groupby('Sub Category', sort=False, dropna=False, observed=True):
+        if pd.notna(sub_category):
+            ax.plot(sub_category_df['Year'], sub_category_df['Value'], marker='o', label=sub_category)
+        else:
+            # Rows without a sub category are drawn unlabelled
+            ax.plot(sub_category_df['Year'], sub_category_df['Value'], marker='o')
+
+    ax.plot(indicator_df['Year'], indicator_df['Target Value'], linestyle='--', label='Target Value',
+            color='purple')
+
+    # Wrap long indicator names to the figure width
+    ax.set_title(textwrap.fill(f"{indicator_number}: {indicator}", width=int(profile.width * 11)))
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Value')
+    ax.legend()
+    fig.tight_layout()
+
+    return _encode(fig, canvas, profile)
+
+
+def _render_task(task, profile):
+    # Timed in the worker; wall-clock start so spans line up across processes
+    start_ns = time.time_ns()
+    start = time.perf_counter_ns()
+    image = render_indicator_chart(*task, profile=profile)
+    return image, start_ns, time.perf_counter_ns() - start, os.getpid()
+
+
+def _indicator_tasks(df_long, indicators):
+    # One pass over df_long instead of a boolean scan per indicator
+    slices = dict(tuple(df_long.groupby('Indicator', sort=False, observed=True)))
+    tasks = []
+    for indicator in indicators:
+        indicator_df = slices.get(indicator)
+        if indicator_df is None or indicator_df.empty:
+            continue
+        indicator_number = indicator_df['Indicator Number'].iloc[0]
+        plot_df = indicator_df[PLOT_COLUMNS].copy()
+        # Ship only this indicator's sub categories, not the whole category list
+        if isinstance(plot_df['Sub Category'].dtype, pd.CategoricalDtype):
+            plot_df['Sub Category'] = plot_df['Sub Category'].cat.remove_unused_categories()
+        tasks.append((indicator, indicator_number, plot_df))
+    return tasks
+
+
+def render_charts(df_long, indicators, max_workers=None, progress=None, cache=None, spool_dir=None,
+                  profile=DEFAULT_PROFILE):
+    """Render every indicator chart, fanned out over a process pool.
+
+    Returns {goal number: [image BytesIO, ...]} with goals in order of first appearance
+    and charts in the order of `indicators`, as create_docx_report expects.
+    profile is a RenderProfile or the name of one in RENDER_PROFILES.
+    If given, progress(done, total) is called after each chart is rendered.
+    With a ChartCache, charts whose data slice and parameters are unchanged are
+    reused and only the rest are rendered. With a spool_dir, each image is
+    written there as soon as it is available and its file path is returned in
+    place of the BytesIO, so memory does not grow with the number of charts.
+    """
+    if isinstance(profile, str):
+        profile = RENDER_PROFILES[profile]
+    render_task = partial(_render_task, profile=profile)
+    params = dict(RENDER_PARAMS, **asdict(profile))
+
+    tracer = current_tracer()
+    with span('chart_tasks'):
+        tasks = _indicator_tasks(df_long, indicators)
+    images = [None] * len(tasks)
+    done = 0
+
+    def keep(i, image):
+        if spool_dir is None:
+            return io.BytesIO(image)
+        path = os.path.join(spool_dir, f'chart-{i}.img')
+        with open(path, 'wb') as f:
+            f.write(image)
+        return path
+
+    with span('chart_cache_lookup', charts=len(tasks)) as lookup:
+        keys = [chart_key(*task, params) for task in tasks] if cache is not None else None
+        pending = []
+        for i, task in enumerate(tasks):
+            image = cache.get(keys[i]) if cache is not None else None
+            if image is None:
+                pending.append(i)
+            else:
+                images[i] = keep(i, image)
+                done += 1
+        lookup['hits'] = done
+    if progress and done:
+        progress(done, len(tasks))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pending)))
+
+    if max_workers == 1:
+        rendered = (render_task(tasks[i]) for i in pending)
+        executor = None
+    else:
+        # spawn keeps the workers free of the parent's threads (Streamlit) and pyplot state
+        context = multiprocessing.get_context('spawn')
+        chunksize = max(1, len(pending) // (max_workers * 4))
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        rendered = executor.map(render_task, [tasks[i] for i in pending], chunksize=chunksize)
+    try:
+        for i, (image, start_ns, duration_ns, pid) in zip(pending, rendered):
+            if tracer is not None:
+                tracer.add('render_chart', start_ns, duration_ns, pid=pid, tid=pid,
+                           indicator=str(tasks[i][0]), bytes=len(image))
+            images[i] = keep(i, image)
+            if cache is not None:
+                cache.put(keys[i], image)
+            done += 1
+            if progress:
+                progress(done, len(tasks))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if cache is not None and pending:
+        cache.prune_disk()
+
+    images_by_goal = {}
+    for (indicator, indicator_number, _), image in zip(tasks, images):
+        goal_index = int(indicator_number.split('.')[0])  # Extract goal number from indicator number
+        images_by_goal.setdefault(goal_index, []).append(image)
+    return images_by_goal
+
+
+def compare_profiles(df_long, indicators, profiles=RENDER_PROFILES, sample=20):
+    """Render the first `sample` indicators with each profile and report the encoded size and time.
+
+    Returns one dict per profile with the bytes saved relative to 'legacy'.
+    """
+    tasks = _indicator_tasks(df_long, indicators)[:sample]
+    results = []
+    for name, profile in profiles.items():
+        start = time.perf_counter()
+        total = sum(len(_render_task(task, profile)[0]) for task in tasks)
+        results.append({'profile': name, 'charts': len(tasks), 'bytes': total,
+                        'seconds': time.perf_counter() - start})
+    legacy = next((r['bytes'] for r in results if r['profile'] == 'legacy'), None)
+    for result in results:
+        result['bytes_saved'] = legacy - result['bytes'] if legacy is not None else None
+    return results
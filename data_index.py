@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# Columns the dashboard filters on; 'Goal' is derived from the Indicator Number prefix
+INDEXED_COLUMNS = ['Goal', 'Indicator', 'Sub Category', 'Department']
+
+
+def goal_numbers(indicator_numbers):
+    """Vectorized goal number ('3.2.1' -> 3) for a Series of indicator numbers."""
+    if isinstance(indicator_numbers.dtype, pd.CategoricalDtype):
+        # Parse each distinct indicator number once and broadcast through the codes
+        goals = goal_numbers(pd.Series(indicator_numbers.cat.categories)).to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = indicator_numbers.cat.codes.to_numpy()
+        values = np.where(codes >= 0, goals[codes], np.nan)
+        return pd.Series(values, index=indicator_numbers.index).astype('Int64')
+    prefix = indicator_numbers.astype(str).str.split('.', n=1).str[0]
+    return pd.to_numeric(prefix, errors='coerce').astype('Int64')
+
+
+class GroupIndex:
+    """Row positions of a frame grouped by the values of one column."""
+
+    def __init__(self, keys):
+        # Codes follow first-appearance order, like Series.unique(); missing keys get -1
+        codes, uniques = pd.factorize(keys)
+        self.values = list(uniques)
+        self._lookup = {value: i for i, value in enumerate(self.values)}
+
+        # A stable sort keeps rows of each group in their original order
+        order = np.argsort(codes, kind='stable')
+        missing = int((codes < 0).sum())
+        self._order = order[missing:]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.values))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def positions(self, value):
+        i = self._lookup.get(value)
+        if i is None:
+            return np.empty(0, dtype=np.intp)
+        return self._order[self._offsets[i]:self._offsets[i + 1]]
+
+
+def group_indexes(df_long):
+    """GroupIndex of every column in INDEXED_COLUMNS."""
+    keys = {
+        'Goal': goal_numbers(df_long['Indicator Number']),
+        'Indicator': df_long['Indicator'],
+        'Sub Category': df_long['Sub Category'],
+        'Department': df_long['Department'],
+    }
+    return {column: GroupIndex(values) for column, values in keys.items()}
+
+
+class DataIndex:
+    """Precomputed group offsets over df_long, so filters cost O(group size) instead of a full scan."""
+
+    def __init__(self, df_long, groups=None):
+        self.df = df_long
+        # groups only depend on df_long, so they can be built once and shared (see derived_cache)
+        self._groups = groups if groups is not None else group_indexes(df_long)
+
+    def values(self, column):
+        """Distinct non-missing values of an indexed column, in order of first appearance."""
+        return self._groups[column].values
+
+    def positions(self, column, value):
+        return self._groups[column].positions(value)
+
+    def rows(self, column, value):
+        # Categorical columns keep every category of df_long; group with observed=True
+        return self.df.iloc[self.positions(column, value)]
+
+    def select(self, criteria):
+        """Rows matching every {column: value} pair in criteria."""
+        positions = None
+        for column, value in criteria.items():
+            group = self.positions(column, value)
+            # Group positions are sorted, so the intersection keeps the original row order
+            positions = group if positions is None else np.intersect1d(positions, group, assume_unique=True)
+        if positions is None:
+            return self.df
+        return self.df.iloc[positions]
@@ -1,20 +1,328 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
 import pandas as pd
 
-def load_data(file_path):
+# Converted workbooks are stored here as one .npy file per column, so every
+# process and session can load them without touching openpyxl again. The
+# numeric columns are memory-mapped, so they are read-only and shared by all
+# server processes.
+CACHE_DIR = os.environ.get('SDG_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+# Rows are matched across workbook versions on these columns
+ROW_KEY = ['Sl No.', 'Indicator Number']
+
+# Expected workbook schema: these columns plus one column per year ('2015', '2016', ...)
+ID_COLUMNS = ['Sl No.', 'Indicator Number', 'Indicator', 'Sub Category', 'Target Year', 'Target Value', 'Department']
+CATEGORY_COLUMNS = ['Indicator Number', 'Indicator', 'Sub Category', 'Department']
+# Year columns after this are ignored. allgoals.xlsx has a '2022' column that is a
+# placeholder (10 in every row), so it must not be read as data yet.
+LAST_YEAR = int(os.environ.get('SDG_LAST_YEAR', '2021'))
+# Bump when the stored layout or dtypes change, so old stores are not reused
+STORE_FORMAT = 2
+
+# (path, mtime_ns, size) -> sha256 of the file, so reruns don't re-hash the workbook
+_signatures = {}
+# (paths, sheet) -> (data version, df_long, indicators), shared by every session of this process
+_loaded = {}
+
+
+def _sources(file_path):
+    # A single workbook path or a list of them
+    if isinstance(file_path, (str, os.PathLike)):
+        return [file_path]
+    return list(file_path)
+
+
+def year_columns(df):
+    """Columns of df named after a year up to LAST_YEAR, as (column, year) pairs in year order."""
+    years = []
+    for column in df.columns:
+        name = str(column).strip()
+        if name.isdigit() and len(name) == 4 and 1900 <= int(name) <= LAST_YEAR:
+            years.append((column, int(name)))
+    return sorted(years, key=lambda item: item[1])
+
+
+def validate_schema(df, source):
+    missing = [column for column in ID_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"{source} is missing the columns {missing}")
+    if not year_columns(df):
+        raise ValueError(f"{source} has no year columns (e.g. '2015') up to {LAST_YEAR}")
+
+
+def _read_workbook(file_path, sheet_name=0):
     skip_rows = 0  # Adjust based on your file
     skip_footer = 0  # Adjust based on your file
     header_row = 0  # Adjust based on your file
 
-    df = pd.read_excel(file_path, skiprows=skip_rows, skipfooter=skip_footer, header=header_row)
+    # sheet_name=None reads every sheet of every workbook into one frame
+    frames = []
+    for source in _sources(file_path):
+        sheets = pd.read_excel(source, sheet_name=sheet_name, skiprows=skip_rows, skipfooter=skip_footer,
+                               header=header_row)
+        if not isinstance(sheets, dict):
+            sheets = {sheet_name: sheets}
+        for name, df in sheets.items():
+            validate_schema(df, f"{source} (sheet {name})")
+            # Year headers may be read as numbers or strings; normalise them to '2015' etc.
+            frames.append(df.rename(columns={column: str(year) for column, year in year_columns(df)}))
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def _melt(df):
     df_long = pd.melt(df,
-                      id_vars=['Sl No.', 'Indicator Number', 'Indicator', 'Sub Category', 'Target Year', 'Target Value', 'Department'],
-                      value_vars=['2015', '2016', '2017', '2018', '2019', '2020', '2021'],
+                      id_vars=ID_COLUMNS,
+                      value_vars=[str(year) for _, year in year_columns(df)],
                       var_name='Year',
                       value_name='Value')
-    df_long['Year'] = df_long['Year'].astype(int)
-    df_long['Value'] = pd.to_numeric(df_long['Value'], errors='coerce')
-    df_long['Target Year'] = pd.to_numeric(df_long['Target Year'], errors='coerce')
-    df_long['Target Value'] = pd.to_numeric(df_long['Target Value'], errors='coerce')
+
+    # Compact dtypes: repeated strings become categories, numbers float32/int16
+    df_long['Year'] = df_long['Year'].astype(np.int16)
+    df_long['Value'] = pd.to_numeric(df_long['Value'], errors='coerce').astype(np.float32)
+    df_long['Target Year'] = pd.to_numeric(df_long['Target Year'], errors='coerce').astype(np.float32)
+    df_long['Target Value'] = pd.to_numeric(df_long['Target Value'], errors='coerce').astype(np.float32)
+    serial = pd.to_numeric(df_long['Sl No.'], errors='coerce')
+    df_long['Sl No.'] = serial.astype(np.int32) if serial.notna().all() else serial.astype(np.float32)
+    for column in CATEGORY_COLUMNS:
+        values = df_long[column]
+        df_long[column] = values.where(values.isna(), values.astype(str)).astype('category')
+    return df_long
+
+
+def _row_table(df):
+    """One hash per workbook row, keyed on ROW_KEY."""
+    keys = df[ROW_KEY[0]].astype(str) + '|' + df[ROW_KEY[1]].astype(str)
+    # Number repeated keys so every row has a unique one
+    keys = keys + '#' + keys.groupby(keys).cumcount().astype(str)
+    return pd.DataFrame({
+        'key': keys,
+        'hash': pd.util.hash_pandas_object(df, index=False).to_numpy(),
+        'Indicator': df['Indicator'].to_numpy(),
+    })
+
+
+def diff_rows(old_rows, new_rows):
+    """Indicators whose rows were added, removed or modified between two row tables."""
+    old = old_rows.set_index('key')
+    new = new_rows.set_index('key')
+    common = old.index.intersection(new.index)
+    modified = common[old.loc[common, 'hash'].to_numpy() != new.loc[common, 'hash'].to_numpy()]
+    removed = old.index.difference(new.index)
+    added = new.index.difference(old.index)
+    indicators = (set(old.loc[removed.union(modified), 'Indicator'].dropna())
+                  | set(new.loc[added.union(modified), 'Indicator'].dropna()))
+    return sorted(indicators, key=str)
+
+
+class DataChanges:
+    """What changed between the previous and the current version of a workbook."""
+
+    def __init__(self, previous, current, indicators):
+        self.previous = previous
+        self.current = current
+        self.indicators = set(indicators)
+
+    def __repr__(self):
+        return f'DataChanges({len(self.indicators)} changed indicators)'
+
+
+def data_version(file_path, sheet_name=0):
+    """Identifier of the data in file_path (one workbook or a list) as the loader reads it."""
+    sha = hashlib.sha256(repr((STORE_FORMAT, LAST_YEAR, sheet_name)).encode())
+    for source in _sources(file_path):
+        sha.update(file_signature(source).encode())
+    return sha.hexdigest()
+
+
+def file_signature(file_path):
+    """Return the sha256 of the workbook, re-hashing only when its mtime or size changes."""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _signatures.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _signatures[key] = digest
+    return digest
+
+
+def _store_dir(file_path, digest):
+    sources = _sources(file_path)
+    stem = os.path.splitext(os.path.basename(sources[0]))[0]
+    if len(sources) > 1:
+        stem += f'+{len(sources) - 1}'
+    return os.path.join(CACHE_DIR, 'data', f'{stem}-{digest[:16]}')
+
+
+def _other_versions(store_dir, file_path, sheet_name):
+    # Stores of other versions of exactly these workbooks and sheet, as (mtime, path).
+    # Matched on the sources recorded in meta.json, since the directory names of
+    # different workbooks can share a prefix (allgoals-..., allgoals-old-...).
+    sources = [os.path.abspath(source) for source in _sources(file_path)]
+    parent = os.path.dirname(store_dir)
+    stores = []
+    for name in os.listdir(parent) if os.path.isdir(parent) else []:
+        path = os.path.join(parent, name)
+        if path == store_dir or name.startswith('.tmp-'):
+            continue
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('sources') == sources and meta.get('sheet', 0) == sheet_name:
+            stores.append((os.path.getmtime(path), path))
+    return stores
+
+
+def _previous_store(store_dir, file_path, sheet_name):
+    # The newest store of another version of the same workbooks, if any
+    stores = _other_versions(store_dir, file_path, sheet_name)
+    return max(stores)[1] if stores else None
+
+
+def _write_store(df_long, rows, changes, store_dir, file_path, sheet_name):
+    os.makedirs(os.path.dirname(store_dir), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(store_dir))
+    columns = []
+    for i, column in enumerate(df_long.columns):
+        values = df_long[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp_dir, f'{i}.codes.npy'), values.cat.codes.to_numpy())
+            np.save(os.path.join(tmp_dir, f'{i}.values.npy'), np.asarray(values.cat.categories, dtype=object),
+                    allow_pickle=True)
+            columns.append({'name': column, 'kind': 'category'})
+        elif values.dtype == object:
+            # Strings are dictionary-encoded: int32 codes plus the distinct values
+            codes, uniques = pd.factorize(values)
+            np.save(os.path.join(tmp_dir, f'{i}.codes.npy'), codes.astype(np.int32))
+            np.save(os.path.join(tmp_dir, f'{i}.values.npy'), np.asarray(uniques, dtype=object), allow_pickle=True)
+            columns.append({'name': column, 'kind': 'object'})
+        else:
+            np.save(os.path.join(tmp_dir, f'{i}.npy'), values.to_numpy())
+            columns.append({'name': column, 'kind': 'array'})
+    rows.to_pickle(os.path.join(tmp_dir, 'rows.pkl'))
+    meta = {
+        'sources': [os.path.abspath(source) for source in _sources(file_path)],
+        'sheet': sheet_name,
+        'digest': changes.current,
+        'rows': len(df_long),
+        'columns': columns,
+        # Recorded at conversion time so every process sees the same change set
+        'changes': {'previous': changes.previous, 'indicators': sorted(changes.indicators, key=str)},
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        # Another process converted the same version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+
+    # Drop stores left behind by older versions of the same workbook
+    for _, path in _other_versions(store_dir, file_path, sheet_name):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _recorded_changes(meta):
+    recorded = meta.get('changes', {})
+    return DataChanges(recorded.get('previous'), meta.get('digest'), recorded.get('indicators', []))
+
+
+def _read_store(store_dir):
+    with open(os.path.join(store_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        if column['kind'] == 'category':
+            codes = np.load(os.path.join(store_dir, f'{i}.codes.npy'), mmap_mode='r')
+            categories = np.load(os.path.join(store_dir, f'{i}.values.npy'), allow_pickle=True)
+            data[column['name']] = pd.Categorical.from_codes(codes, categories)
+        elif column['kind'] == 'object':
+            codes = np.load(os.path.join(store_dir, f'{i}.codes.npy'), mmap_mode='r')
+            uniques = np.load(os.path.join(store_dir, f'{i}.values.npy'), allow_pickle=True)
+            # factorize marks missing values with -1
+            values = np.empty(len(codes), dtype=object)
+            present = codes >= 0
+            values[present] = uniques[codes[present]]
+            values[~present] = np.nan
+            data[column['name']] = values
+        else:
+            data[column['name']] = np.load(os.path.join(store_dir, f'{i}.npy'), mmap_mode='r')
+    changes = _recorded_changes(meta)
+    # copy=False keeps the columns on the memory-mapped files instead of consolidating
+    # them into new blocks, so every process shares the same read-only pages
+    return pd.DataFrame(data, copy=False), changes
+
+
+def _convert(file_path, sheet_name, store_dir, digest):
+    # Cold start: pay the Excel cost once per file version
+    df = _read_workbook(file_path, sheet_name)
+    df_long = _melt(df)
+    rows = _row_table(df)
+
+    # Compare row hashes with the version this one replaces
+    changes = DataChanges(None, digest, rows['Indicator'].dropna())
+    previous_dir = _previous_store(store_dir, file_path, sheet_name)
+    if previous_dir is not None:
+        try:
+            with open(os.path.join(previous_dir, 'meta.json')) as f:
+                previous = json.load(f)['digest']
+            old_rows = pd.read_pickle(os.path.join(previous_dir, 'rows.pkl'))
+            changes = DataChanges(previous, digest, diff_rows(old_rows, rows))
+        except (OSError, KeyError) as e:
+            print(f"Could not compare with the previous data version: {e}")
+
+    try:
+        _write_store(df_long, rows, changes, store_dir, file_path, sheet_name)
+    except OSError as e:
+        print(f"Could not write data cache {store_dir}: {e}")
+    return df_long, changes
+
+
+def load_data(file_path, sheet_name=0):
+    """Load one workbook, or a list of workbooks merged into one frame, in long format.
+
+    sheet_name selects the sheet of each workbook; None merges every sheet.
+    Returns (df_long, indicators).
+    """
+    path = (tuple(os.path.abspath(source) for source in _sources(file_path)), sheet_name)
+    digest = data_version(file_path, sheet_name)
+    loaded = _loaded.get(path)
+    if loaded is not None and loaded[0] == digest:
+        return loaded[1], loaded[2]
+
+    store_dir = _store_dir(file_path, digest)
+    if os.path.exists(os.path.join(store_dir, 'meta.json')):
+        df_long, _ = _read_store(store_dir)
+    else:
+        df_long, _ = _convert(file_path, sheet_name, store_dir, digest)
 
     indicators = df_long['Indicator'].unique()
+    _loaded[path] = (digest, df_long, indicators)
     return df_long, indicators
+
+
+def data_changes(file_path, sheet_name=0):
+    """DataChanges of the currently stored version of file_path relative to the one before it.
+
+    None if the version has not been stored (e.g. the cache directory is not writable).
+    """
+    store_dir = _store_dir(file_path, data_version(file_path, sheet_name))
+    try:
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            return _recorded_changes(json.load(f))
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,105 @@
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+
+from data_loader import CACHE_DIR
+
+DERIVED_DIR = os.path.join(CACHE_DIR, 'derived')
+
+# Bump when DashboardAggregates, group_indexes, the forecast table or anything
+# else stored here changes shape, so a deploy does not read the old pickles
+DERIVED_FORMAT = 2
+
+# Versions kept on disk, so processes still serving the previous version keep their files
+KEEP_VERSIONS = 2
+
+# Buffers are aligned in the data file so the arrays mapped onto them are too
+_ALIGN = 64
+
+
+def _paths(name, version):
+    directory = os.path.join(DERIVED_DIR, version[:16])
+    stem = f'{name}-v{DERIVED_FORMAT}'
+    return directory, os.path.join(directory, f'{stem}.pkl'), os.path.join(directory, f'{stem}.bin')
+
+
+def _dump(result, directory, header_path, data_path):
+    # NumPy arrays (and the pandas blocks built on them) are written out of band
+    # to the data file, so readers can map them instead of copying them
+    buffers = []
+    header = pickle.dumps(result, protocol=5, buffer_callback=buffers.append)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_data = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    layout = []
+    with os.fdopen(fd, 'wb') as f:
+        for buffer in buffers:
+            view = buffer.raw()
+            f.write(b'\0' * (-f.tell() % _ALIGN))
+            layout.append((f.tell(), view.nbytes))
+            f.write(view)
+    fd, tmp_header = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump((layout, header), f, protocol=5)
+    # The header is renamed last, so a reader never sees it without its data
+    os.replace(tmp_data, data_path)
+    os.replace(tmp_header, header_path)
+
+
+def _load(header_path, data_path):
+    with open(header_path, 'rb') as f:
+        layout, header = pickle.load(f)
+    if not layout:
+        return pickle.loads(header)
+    with open(data_path, 'rb') as f:
+        # Read-only and shared: every process maps the same pages of the file
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    return pickle.loads(header, buffers=[view[offset:offset + size] for offset, size in layout])
+
+
+def _prune(keep):
+    entries = []
+    for name in os.listdir(DERIVED_DIR):
+        path = os.path.join(DERIVED_DIR, name)
+        if os.path.isdir(path):
+            entries.append((os.path.getmtime(path), path))
+    entries.sort(reverse=True)
+    for _, path in entries[KEEP_VERSIONS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def cached_result(name, version):
+    """The shared result stored for name and version, or None if there is none."""
+    _, header_path, data_path = _paths(name, version)
+    try:
+        return _load(header_path, data_path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Any unreadable entry (truncated, or pickled by older code whose classes have
+        # since moved) is a miss; it is recomputed and overwritten
+        print(f"Could not read derived cache entry {header_path}: {e}")
+        return None
+
+
+def shared_result(name, version, compute):
+    """Result of compute() for one data version, computed once and shared by every process.
+
+    The result is pickled to DERIVED_DIR and its arrays are memory-mapped when
+    loaded, so they are read-only and workers share one copy in the page cache.
+    """
+    result = cached_result(name, version)
+    if result is not None:
+        return result
+
+    directory, header_path, data_path = _paths(name, version)
+    result = compute()
+    try:
+        _dump(result, directory, header_path, data_path)
+        _prune(directory)
+    except (OSError, pickle.PicklingError) as e:
+        print(f"Could not write derived cache entry {header_path}: {e}")
+    return result
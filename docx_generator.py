@@ -1,87 +1,200 @@
-import matplotlib.pyplot as plt
 from docx import Document
 from docx.shared import Inches, Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.enum.section import  WD_SECTION_START
-import streamlit as st
 import docx
 import pandas as pd
 import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
 import time
-import io
 import urllib.request
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from PIL import Image,UnidentifiedImageError
+from chart_cache import shared_cache
+from chart_renderer import DEFAULT_PROFILE, render_charts
+from data_index import goal_numbers
+from data_loader import CACHE_DIR
+from forecasts import STATUSES, status_counts
+from instrumentation import span
+
+# Cover page image. A local copy is used when present; otherwise it is downloaded
+# on the first report build (with a timeout) and kept in the on-disk cache.
+COVER_IMAGE_URL = 'https://drive.google.com/uc?export=download&id=1nB6n0ENZPHquN6hYl3sf7dlXGn5aP7kD'
+COVER_IMAGE_FILE = os.environ.get('SDG_COVER_IMAGE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cover_image.png'))
+COVER_IMAGE_CACHE = os.path.join(CACHE_DIR, 'cover_image')
+COVER_FETCH_TIMEOUT = 10  # seconds
+# After a failed download, reports go without a cover until this many seconds have passed
+COVER_RETRY_INTERVAL = 5 * 60
+
+_cover_image = None
+_cover_failed_at = None
+_cover_lock = threading.Lock()
+
+
+def _open_cover(content):
+    return Image.open(io.BytesIO(content)).convert("RGB")
+
+
+def get_cover_image():
+    """Load the cover image lazily; returns None if it is unavailable."""
+    global _cover_image, _cover_failed_at
+    with _cover_lock:
+        if _cover_image is not None:
+            return _cover_image
+        if _cover_failed_at is not None and time.monotonic() - _cover_failed_at < COVER_RETRY_INTERVAL:
+            return None
+
+        for path in (COVER_IMAGE_FILE, COVER_IMAGE_CACHE):
+            if os.path.exists(path):
+                try:
+                    with open(path, 'rb') as f:
+                        _cover_image = _open_cover(f.read())
+                    return _cover_image
+                except (OSError, UnidentifiedImageError) as e:
+                    print(f"Ignoring unreadable cover image {path}: {e}")
+
+        try:
+            content = urllib.request.urlopen(COVER_IMAGE_URL, timeout=COVER_FETCH_TIMEOUT).read()
+            _cover_image = _open_cover(content)
+        except UnidentifiedImageError:
+            print("The image could not be identified or is not in a valid format.")
+            _cover_failed_at = time.monotonic()
+            return None
+        except Exception as e:
+            # Remembered, so builds in the next COVER_RETRY_INTERVAL don't wait on the network again
+            print(f"An error occurred while fetching the image: {e}")
+            _cover_failed_at = time.monotonic()
+            return None
+
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, COVER_IMAGE_CACHE)
+        except OSError as e:
+            print(f"Could not cache the cover image: {e}")
+        return _cover_image
 
-# your avatar URL as example
-url = ('https://drive.google.com/uc?export=download&id=1nB6n0ENZPHquN6hYl3sf7dlXGn5aP7kD')
-try:
-    content = urllib.request.urlopen(url).read()
-    cover_image = Image.open(io.BytesIO(content))
-    cover_image = cover_image.convert("RGB")
-except UnidentifiedImageError:
-    st.error("The image could not be identified or is not in a valid format.")
-    cover_image = None
-except Exception as e:
-    st.error(f"An error occurred while fetching the image: {e}")
-    cover_image = None
-
-def generate_docx_report(df_long, indicators):
-    # Dictionary to store images by indicator number
-    images_by_goal = {}
-    message_placeholder = st.empty()
-    message_placeholder.success("Report generation started. Please wait for a minute to generate the report.")
-    time.sleep(5)
-    message_placeholder.empty()
-
-    for indicator in indicators:
-        print(f"Processing indicator: {indicator}")
-        indicator_df = df_long[df_long['Indicator'] == indicator]
-        if indicator_df.empty:
-            continue
-
-        indicator_number = indicator_df['Indicator Number'].iloc[0]
-        goal_index = int(indicator_number.split('.')[0])  # Extract goal number from indicator number
-
-        # Plotting
-        plt.figure(figsize=(20, 10))
-
-        for sub_category in indicator_df['Sub Category'].unique():
-            sub_category_df = indicator_df[indicator_df['Sub Category'] == sub_category]
-            if not sub_category_df.empty:
-                plt.plot(sub_category_df['Year'], sub_category_df['Value'], marker='o', label=sub_category)
-            else:
-                if str(indicator_df['Target Value']) != 'nan':
-                    plt.plot(indicator_df['Year'], indicator_df['Value'], marker='o')
 
-        plt.plot(indicator_df['Year'], indicator_df['Target Value'], linestyle='--', label='Target Value',
-                 color='purple')
+def _selected_rows(df_long, goals, departments):
+    mask = pd.Series(True, index=df_long.index)
+    if goals is not None:
+        mask &= goal_numbers(df_long['Indicator Number']).isin([int(goal) for goal in goals])
+    if departments is not None:
+        mask &= df_long['Department'].isin(list(departments))
+    return mask
 
-        plt.title(f"{indicator_number}: {indicator}")
-        plt.xlabel('Year')
-        plt.ylabel('Value')
-        plt.legend()
 
-        # Save plot to buffer
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
-        plt.close()
-        img_buffer.seek(0)
+def select_indicators(df_long, indicators, goals=None, departments=None):
+    """The indicators of `indicators` in any of `goals` and any of `departments`, in their original order.
 
-        if goal_index not in images_by_goal:
-            images_by_goal[goal_index] = []
-        images_by_goal[goal_index].append(img_buffer)
+    None selects every goal or department.
+    """
+    selected = set(df_long.loc[_selected_rows(df_long, goals, departments), 'Indicator'].dropna())
+    return [indicator for indicator in indicators if indicator in selected]
 
-    message_placeholder.success("Processing almost done. The report will be generated in less than a minute.")
-    time.sleep(5)
-    message_placeholder.empty()
 
-    # Create the DOCX report
-    docx_file = create_docx_report(images_by_goal,cover_image)
+def select_indicator_numbers(df_long, goals=None, departments=None):
+    """Indicator Numbers in any of `goals` and any of `departments`, or None when neither is given."""
+    if goals is None and departments is None:
+        return None
+    return set(df_long.loc[_selected_rows(df_long, goals, departments), 'Indicator Number'].dropna())
+
+
+def generate_docx_report(df_long, indicators, max_workers=None, progress=None, use_cache=True, output=None,
+                         profile=DEFAULT_PROFILE, goals=None, departments=None, split=False, forecasts=None):
+    """Render the charts of `indicators` and build the report.
+
+    goals and departments narrow the report to the indicators in them, so only
+    their charts are rendered. With split, output receives a ZIP of one document
+    per goal, built in parallel; otherwise one document with every goal.
+    With forecasts (see forecasts.get_forecasts), each goal gets a target outlook line.
+    """
+    if goals is not None or departments is not None:
+        indicators = select_indicators(df_long, indicators, goals, departments)
+    outlook = None
+    if forecasts is not None:
+        outlook = status_counts(forecasts, indicators, select_indicator_numbers(df_long, goals, departments))
+
+    # Charts are spooled to a temporary directory as they are rendered and streamed
+    # into the package, so memory stays flat however many indicators there are.
+    with tempfile.TemporaryDirectory(prefix='sdg-report-') as spool_dir:
+        # Render the indicator charts in parallel, grouped by goal, reusing cached charts
+        # whose data has not changed. progress(done, total) is called once per indicator.
+        with span('render_charts', charts=len(indicators)):
+            images_by_goal = render_charts(df_long, indicators, max_workers=max_workers, progress=progress,
+                                           cache=shared_cache if use_cache else None, spool_dir=spool_dir,
+                                           profile=profile)
+
+        with span('cover_image'):
+            cover_image = get_cover_image()
+
+        # Create the DOCX report
+        with span('create_docx_report', split=split):
+            if split:
+                paths = create_goal_reports(images_by_goal, cover_image, spool_dir, max_workers=max_workers,
+                                            outlook=outlook)
+                docx_file = zip_reports(paths, output)
+            else:
+                docx_file = create_docx_report(images_by_goal, cover_image, output=output, outlook=outlook)
 
     return docx_file
 
+
+def _goal_report(goal_index, goal_images, cover_image, path, outlook=None):
+    # Runs in a worker process; spooled image paths are read from the parent's spool directory
+    create_docx_report({goal_index: goal_images}, cover_image, output=path, outlook=outlook)
+    return path
+
+
+def create_goal_reports(images_by_goal, cover_image, directory, name='final_report', max_workers=None,
+                        outlook=None):
+    """Write one report per goal to directory, building them in parallel processes.
+
+    Returns {goal: path} with the goals in the order of images_by_goal.
+    """
+    paths = {goal_index: os.path.join(directory, f'{name}_goal_{goal_index}.docx') for goal_index in images_by_goal}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(paths)))
+
+    if max_workers == 1:
+        for goal_index, goal_images in images_by_goal.items():
+            _goal_report(goal_index, goal_images, cover_image, paths[goal_index], outlook)
+        return paths
+
+    # BytesIO charts cannot be shared with the workers, so only spooled paths are sent as-is
+    jobs = [(goal_index, [image if isinstance(image, (str, os.PathLike)) else image.getvalue() for image in goal_images])
+            for goal_index, goal_images in images_by_goal.items()]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [executor.submit(_goal_report, goal_index, goal_images, cover_image, paths[goal_index], outlook)
+                   for goal_index, goal_images in jobs]
+        for future in futures:
+            future.result()
+    return paths
+
+
+def zip_reports(paths, output=None):
+    """Bundle {goal: report path} into a ZIP at output (a path or binary file; a new BytesIO if None)."""
+    if output is None:
+        output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for path in paths.values():
+            # DOCX files are already deflated
+            archive.write(path, os.path.basename(path), compress_type=zipfile.ZIP_STORED)
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
+
 def add_border(section, color):
     """Add border color for a section based on the SDG goal."""
     sectPr = section._sectPr
@@ -96,7 +209,100 @@ def add_border(section, color):
         pgBorders.append(border)
     sectPr.append(pgBorders)
 
-def create_docx_report(images_by_goal, cover_image):
+def _add_bookmark(paragraph, name, bookmark_id):
+    start = OxmlElement('w:bookmarkStart')
+    start.set(qn('w:id'), str(bookmark_id))
+    start.set(qn('w:name'), name)
+    end = OxmlElement('w:bookmarkEnd')
+    end.set(qn('w:id'), str(bookmark_id))
+    paragraph._p.append(start)
+    paragraph._p.append(end)
+
+def _add_page_ref(paragraph, bookmark, estimate):
+    """PAGEREF field showing the page of bookmark; estimate is displayed until Word updates the field."""
+    fldSimple = OxmlElement('w:fldSimple')
+    fldSimple.set(qn('w:instr'), f'PAGEREF {bookmark} \\h')
+    run = OxmlElement('w:r')
+    text = OxmlElement('w:t')
+    text.text = str(estimate)
+    run.append(text)
+    fldSimple.append(run)
+    paragraph._p.append(fldSimple)
+
+def _update_fields_on_open(doc):
+    # Ask Word to recompute the page references when the document is opened
+    update = OxmlElement('w:updateFields')
+    update.set(qn('w:val'), 'true')
+    doc.settings.element.insert_element_before(
+        update, 'w:hdrShapeDefaults', 'w:footnotePr', 'w:endnotePr', 'w:compat', 'w:docVars', 'w:rsids',
+        'w:attachedSchema', 'w:themeFontLang', 'w:clrSchemeMapping', 'w:doNotIncludeSubdocsInStats',
+        'w:doNotAutoCompressPictures', 'w:forceUpgrade', 'w:captions', 'w:readModeInkLockDown', 'w:smartTagType',
+        'w:shapeDefaults', 'w:doNotEmbedSmartTags', 'w:decimalSymbol', 'w:listSeparator')
+
+def _placeholder_image(n, image_format):
+    # A tiny image of a unique size, so python-docx stores every placeholder as its own part
+    buffer = io.BytesIO()
+    Image.new('RGB', (1 + n % 1024, 1 + n // 1024)).save(buffer, format=image_format)
+    buffer.seek(0)
+    return buffer
+
+def _image_format(path):
+    with open(path, 'rb') as f:
+        signature = f.read(8)
+    if signature.startswith(b'\xff\xd8'):
+        return 'JPEG'
+    if signature == b'\x89PNG\r\n\x1a\n':
+        return 'PNG'
+    raise ValueError(f"{path} is neither a PNG nor a JPEG image")
+
+def _add_spooled_picture(doc, path, spooled, width, height):
+    """Add a placeholder picture now and remember which file replaces it when the package is written."""
+    inline_shape = doc.add_picture(_placeholder_image(len(spooled), _image_format(path)), width=width, height=height)
+    rId = inline_shape._inline.graphic.graphicData.pic.blipFill.blip.embed
+    partname = doc.part.related_parts[rId].partname
+    spooled[partname.lstrip('/')] = path
+
+def _save_docx(doc, spooled, output):
+    """Save doc to output (a path or binary file; a new BytesIO if None), streaming spooled images into it."""
+    if output is None:
+        output = io.BytesIO()
+    if not spooled:
+        doc.save(output)
+    else:
+        with tempfile.TemporaryFile() as skeleton:
+            doc.save(skeleton)
+            skeleton.seek(0)
+            with zipfile.ZipFile(skeleton) as src, zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as dst:
+                for item in src.infolist():
+                    info = zipfile.ZipInfo(item.filename, date_time=item.date_time)
+                    path = spooled.get(item.filename)
+                    if path is None:
+                        info.compress_type = item.compress_type
+                        with src.open(item) as part, dst.open(info, 'w') as out:
+                            shutil.copyfileobj(part, out)
+                    else:
+                        # Images are already compressed; copy them in chunks without recompressing
+                        info.compress_type = zipfile.ZIP_STORED
+                        with open(path, 'rb') as image, dst.open(info, 'w', force_zip64=True) as out:
+                            shutil.copyfileobj(image, out)
+    if hasattr(output, 'seek'):
+        output.seek(0)
+    return output
+
+def _outlook_text(counts):
+    parts = [f"{counts[status]} {status.lower()}" for status in STATUSES if counts.get(status)]
+    return 'Target outlook: ' + ', '.join(parts) + '.' if parts else None
+
+def create_docx_report(images_by_goal, cover_image, output=None, outlook=None):
+    """Build the report from {goal: [image BytesIO or spooled image path, ...]}.
+
+    Pictures given as paths are streamed into the package from disk when it is
+    written. Image bytes are accepted too. outlook ({goal: {status: count}},
+    see forecasts.status_counts) adds a line under each goal heading. The
+    document goes to output (a path or binary file) if given, otherwise to a
+    new BytesIO, which is returned.
+    """
+    spooled = {}
     doc = Document()
 
     if cover_image:
@@ -126,14 +332,16 @@ def create_docx_report(images_by_goal, cover_image):
     hdr_cells[1].text = 'SDG Goal'
     hdr_cells[2].text = 'Page No.'
 
+    # Page numbers are PAGEREF fields to a bookmark on each goal heading, which Word
+    # fills in exactly; the estimate (two charts per page) is shown until then
     page_number = 3
-    for i, goal in enumerate(sdg_goals, start=1):
-        l = len(images_by_goal.get(i, []))
+    for goal_index, goal_images in images_by_goal.items():
         row_cells = table.add_row().cells
-        row_cells[0].text = str(i)
-        row_cells[1].text = goal
-        row_cells[2].text = str(page_number)
-        page_number += l // 2 + 1 if l % 2 else l // 2
+        row_cells[0].text = str(goal_index)
+        row_cells[1].text = sdg_goals[goal_index - 1]
+        _add_page_ref(row_cells[2].paragraphs[0], f'sdg_goal_{goal_index}', page_number)
+        page_number += max(1, -(-len(goal_images) // 2))
+    _update_fields_on_open(doc)
 
     # Add a section break to start the new section after the index, but don't insert a page break
     section = doc.add_section(WD_SECTION_START.CONTINUOUS)
@@ -169,14 +377,22 @@ def create_docx_report(images_by_goal, cover_image):
         # Add goal heading
         goal_heading = doc.add_heading(f'SDG {goal_index}: {sdg_goals[goal_index - 1]}', level=2)
         goal_heading.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+        _add_bookmark(goal_heading, f'sdg_goal_{goal_index}', goal_index)
 
-        for img_buffer in goal_images:
-            img_buffer.seek(0)
-            doc.add_picture(img_buffer, width=Inches(6), height=Inches(4))
+        outlook_text = _outlook_text(outlook.get(goal_index, {})) if outlook else None
+        if outlook_text:
+            outlook_paragraph = doc.add_paragraph(outlook_text)
+            outlook_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-    # Use buffer for the DOCX file
-    docx_buffer = io.BytesIO()
-    doc.save(docx_buffer)
-    docx_buffer.seek(0)
+        for img_buffer in goal_images:
+            if isinstance(img_buffer, (str, os.PathLike)):
+                _add_spooled_picture(doc, img_buffer, spooled, width=Inches(6), height=Inches(4))
+            elif isinstance(img_buffer, bytes):
+                doc.add_picture(io.BytesIO(img_buffer), width=Inches(6), height=Inches(4))
+            else:
+                img_buffer.seek(0)
+                doc.add_picture(img_buffer, width=Inches(6), height=Inches(4))
 
-    return docx_buffer
+    # Write the DOCX file, streaming spooled images into it
+    with span('save_docx', spooled=len(spooled)):
+        return _save_docx(doc, spooled, output)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_index import goal_numbers
+from derived_cache import cached_result, shared_result
+from trendlines import fit_trendlines
+
+# One projected series per indicator and sub category. Indicator Number is part of
+# the key because some indicator names are shared by two numbers (e.g. 14.2.1 and 14.5.2).
+SERIES_COLUMNS = ['Indicator Number', 'Indicator', 'Sub Category']
+
+# Status order of the ranked table
+STATUSES = ['Met', 'On track', 'Off track', 'No trend', 'Unknown direction']
+
+# Whether each indicator should increase or decrease towards its target, e.g.
+# {"5.2.1": "decrease", "9.2.1": "increase"}, keyed by Indicator Number. The
+# workbook does not say, and guessing it mislabels indicators moving the wrong
+# way, so series not listed here get the 'Unknown direction' status.
+DIRECTIONS_FILE = os.environ.get('SDG_TARGET_DIRECTIONS',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), 'target_directions.json'))
+
+
+def load_directions(path=DIRECTIONS_FILE):
+    """{indicator number: 1.0 (increase) or -1.0 (decrease)} from the directions file, if there is one."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        raw = json.load(f)
+    directions = {}
+    for number, direction in raw.items():
+        value = str(direction).strip().lower()
+        if value not in ('increase', 'decrease'):
+            raise ValueError(f"{path}: direction of {number} must be 'increase' or 'decrease', not {direction!r}")
+        directions[str(number).strip()] = 1.0 if value == 'increase' else -1.0
+    return directions
+
+
+def forecast_targets(df_long, directions=None):
+    """Project every indicator/sub category series to its Target Year in one vectorized pass.
+
+    directions defaults to load_directions(). A series is Met when its latest
+    value meets the target, On track when its linear trend reaches the target
+    by the Target Year, and Off track otherwise; series without a target or
+    with fewer than two years are No trend, and those without a known
+    direction are Unknown direction. Year Reached is the year the current run
+    of meeting the target began or, if it is not met, the year the trend
+    reaches it (NA if it never does). Rows are ranked by status, then by the
+    smallest projected shortfall.
+    """
+    if directions is None:
+        directions = load_directions()
+    data = df_long[df_long['Value'].notna()].sort_values('Year', kind='stable')
+    grouped = data.groupby(SERIES_COLUMNS, sort=False, dropna=False, observed=True)
+    series = grouped.ngroup().to_numpy()
+
+    first = grouped.first()
+    numbers = pd.Series(first.index.get_level_values('Indicator Number'))
+    table = pd.DataFrame({
+        'Goal': goal_numbers(numbers).to_numpy(),
+        'Department': first['Department'].to_numpy(),
+        'Target Value': first['Target Value'].to_numpy(dtype=np.float64),
+        'Target Year': first['Target Year'].to_numpy(dtype=np.float64),
+        'Latest Year': grouped['Year'].last().to_numpy(),
+        'Latest Value': grouped['Value'].last().to_numpy(dtype=np.float64),
+    }, index=first.index)
+
+    # Rows sorted by year, so the fitted groups come back in ngroup order
+    fits = fit_trendlines(data.assign(Series=series), group_col='Series')
+    slope = fits['slope'].to_numpy()
+    intercept = fits['intercept'].to_numpy()
+    target = table['Target Value'].to_numpy()
+    target_year = table['Target Year'].to_numpy()
+    direction = numbers.astype(str).str.strip().map(directions).to_numpy(dtype=np.float64)
+    known = ~np.isnan(direction) & ~np.isnan(target)
+
+    # Start of the latest run of years meeting the target
+    years = data['Year'].to_numpy(dtype=np.float64)
+    met_rows = data['Value'].to_numpy(dtype=np.float64) * direction[series] >= target[series] * direction[series]
+    last_unmet = pd.Series(np.where(met_rows, np.nan, years)).groupby(series).max().reindex(range(len(table)))
+    after = years > last_unmet.fillna(-np.inf).to_numpy()[series]
+    met_since = (pd.Series(np.where(met_rows & after, years, np.nan)).groupby(series).min()
+                 .reindex(range(len(table))).to_numpy())
+
+    latest = table['Latest Value'].to_numpy()
+    is_met = known & (latest * direction >= target * direction)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        projected = intercept + slope * target_year
+        crossing = np.ceil((target - intercept) / slope)
+    latest_year = table['Latest Year'].to_numpy(dtype=np.float64)
+    towards = slope * direction > 0
+    trend_year = np.where(towards, np.maximum(crossing, latest_year + 1), np.nan)
+    year_reached = np.where(is_met, met_since, trend_year)
+
+    has_trend = (fits['n'].to_numpy() >= 2) & (fits['sxx'].to_numpy() > 0) & ~np.isnan(target)
+    on_track = known & has_trend & (year_reached <= target_year)
+    status = np.select([is_met, on_track, known & has_trend, known | ~has_trend],
+                       STATUSES[:4], STATUSES[4])
+
+    table['Direction'] = np.select([direction > 0, direction < 0], ['Increase', 'Decrease'], 'Unknown')
+    table['Slope'] = slope
+    table['Projected Value'] = np.where(has_trend, projected, np.nan)
+    # Shortfall of the projection at the Target Year, relative to the target (negative: past it).
+    # NaN for a zero target, where a relative gap is undefined.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap = (target - table['Projected Value'].to_numpy()) * direction / np.abs(target)
+    table['Projected Gap'] = np.where(target != 0, gap, np.nan)
+    table['Year Reached'] = pd.array(np.where(is_met | (known & has_trend), year_reached, np.nan)).astype('Int64')
+    table['Status'] = pd.Categorical(status, categories=STATUSES, ordered=True)
+
+    return _rank(table.reset_index())
+
+
+def _rank(table):
+    table = table.drop(columns='Rank', errors='ignore')
+    table['Status'] = pd.Categorical(table['Status'], categories=STATUSES, ordered=True)
+    table = table.sort_values(['Status', 'Projected Gap'], kind='stable', na_position='last').reset_index(drop=True)
+    table.insert(0, 'Rank', np.arange(1, len(table) + 1))
+    return table
+
+
+def _refresh(df_long, previous, changed, directions):
+    # Refit only the changed indicators and reuse the other rows of the previous version.
+    # Every series sharing a name or an Indicator Number with a changed one is refitted.
+    numbers = (set(previous.loc[previous['Indicator'].isin(changed), 'Indicator Number'])
+               | set(df_long.loc[df_long['Indicator'].isin(changed), 'Indicator Number']))
+    kept = previous[~(previous['Indicator'].isin(changed) | previous['Indicator Number'].isin(numbers))]
+    changed_rows = df_long[df_long['Indicator'].isin(changed) | df_long['Indicator Number'].isin(numbers)]
+    if changed_rows.empty:
+        return _rank(kept.copy())
+    return _rank(pd.concat([kept, forecast_targets(changed_rows, directions)], ignore_index=True))
+
+
+def get_forecasts(df_long, version, changes=None):
+    """forecast_targets(df_long), computed once per data version and shared by the dashboard, reports and CLI.
+
+    changes (data_loader.data_changes) lets a new version refit only its changed
+    indicators when the forecasts of the version it replaces are still cached.
+    """
+    directions = load_directions()
+    # The directions are part of the key, so editing the file re-derives every status
+    name = 'forecasts-' + hashlib.sha256(json.dumps(directions, sort_keys=True).encode()).hexdigest()[:12]
+
+    def compute():
+        if changes is not None and changes.previous is not None and changes.current == version:
+            previous = cached_result(name, changes.previous)
+            if previous is not None:
+                return _refresh(df_long, previous, changes.indicators, directions)
+        return forecast_targets(df_long, directions)
+
+    return shared_result(name, version, compute)
+
+
+def scoped(forecasts, indicators, indicator_numbers=None):
+    """The forecast rows of the given indicators, e.g. those a scoped report covers.
+
+    indicator_numbers further limits them to those numbers, for names shared by several numbers.
+    """
+    selected = forecasts['Indicator'].isin(list(indicators))
+    if indicator_numbers is not None:
+        selected &= forecasts['Indicator Number'].isin(list(indicator_numbers))
+    return forecasts[selected]
+
+
+def status_counts(forecasts, indicators=None, indicator_numbers=None):
+    """{goal: {status: number of series}} for the report's per-goal outlook lines.
+
+    With indicators (and indicator_numbers), only their series are counted, so
+    the lines match the charts of a scoped report.
+    """
+    if indicators is not None:
+        forecasts = scoped(forecasts, indicators, indicator_numbers)
+    # Goals without any series of known direction get no line; it would only list
+    # 'no trend' and 'unknown direction' counts
+    assessed = forecasts.loc[forecasts['Direction'] != 'Unknown', 'Goal'].dropna().unique()
+    counts = forecasts[forecasts['Goal'].isin(assessed)].groupby(['Goal', 'Status'], observed=False).size()
+    return {int(goal): {status: int(count) for status, count in counts[goal].items() if count}
+            for goal in counts.index.get_level_values('Goal').unique() if pd.notna(goal)}
+
+
+def has_directions(forecasts):
+    """Whether any series has a configured direction, i.e. whether the outlook says anything."""
+    return bool((forecasts['Direction'] != 'Unknown').any())
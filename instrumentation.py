@@ -0,0 +1,96 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('sdg.timing')
+
+# The tracer spans are recorded into; None (the default) makes span() a no-op
+_active = contextvars.ContextVar('sdg_tracer', default=None)
+
+
+class Tracer:
+    """Collects timing spans for one rerun or one report build."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start_ns, duration_ns, pid=None, tid=None, **attrs):
+        """Record a span measured elsewhere, e.g. in a worker process. start_ns is time.time_ns()."""
+        record = {
+            'name': name,
+            'start_ns': start_ns,
+            'duration_ms': duration_ns / 1e6,
+            'pid': pid if pid is not None else os.getpid(),
+            'tid': tid if tid is not None else threading.get_ident(),
+            'attrs': attrs,
+        }
+        with self._lock:
+            self.spans.append(record)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(record, default=str))
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start_ns = time.time_ns()
+        start = time.perf_counter_ns()
+        try:
+            yield attrs
+        finally:
+            self.add(name, start_ns, time.perf_counter_ns() - start, **attrs)
+
+    def summary(self):
+        """Count, total and max duration per span name, slowest total first."""
+        totals = {}
+        for record in self.spans:
+            entry = totals.setdefault(record['name'], {'span': record['name'], 'count': 0, 'total_ms': 0.0,
+                                                       'max_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += record['duration_ms']
+            entry['max_ms'] = max(entry['max_ms'], record['duration_ms'])
+        return sorted(totals.values(), key=lambda entry: entry['total_ms'], reverse=True)
+
+    def to_json_lines(self):
+        return ''.join(json.dumps(record, default=str) + '\n' for record in self.spans)
+
+    def to_chrome_trace(self):
+        """The spans in Chrome trace event format (load in chrome://tracing or Perfetto)."""
+        events = [{
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start_ns'] / 1e3,
+            'dur': record['duration_ms'] * 1e3,
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': record['attrs'],
+        } for record in self.spans]
+        return json.dumps({'traceEvents': events}, default=str)
+
+
+def current_tracer():
+    return _active.get()
+
+
+@contextmanager
+def use_tracer(tracer):
+    """Record spans opened in this context (thread or rerun) into tracer."""
+    token = _active.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed block into the active tracer; does nothing when none is active."""
+    tracer = _active.get()
+    if tracer is None:
+        yield attrs
+    else:
+        with tracer.span(name, **attrs) as span_attrs:
+            yield span_attrs
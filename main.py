@@ -1,11 +1,206 @@
 import streamlit as st
+import pandas as pd
 import plotly.express as px
-from data_loader import load_data
-from docx_generator import generate_docx_report
+from aggregates import DashboardAggregates
+from data_index import DataIndex, group_indexes
+from data_loader import data_changes, data_version, load_data
+from derived_cache import shared_result
+from forecasts import get_forecasts, has_directions
+from instrumentation import Tracer, span, use_tracer
+from payloads import PAGE_SIZE, line_figure, page_count, table_page
 from plots import generate_trendline_plot
+from report_jobs import discard_job, get_job, submit_report
+from targets import evaluate_targets
+
+DATA_FILE = 'allgoals.xlsx'
+
+
+@st.cache_resource(max_entries=2)
+def get_index(version, _df_long):
+    # Built once per data version by the first server process and mapped by the others
+    return DataIndex(_df_long, shared_result('index', version, lambda: group_indexes(_df_long)))
+
+
+@st.cache_resource(max_entries=2)
+def get_aggregates(version, _df_long):
+    # Computed once per data version; every tab reads the same read-only tables
+    return shared_result('aggregates', version, lambda: DashboardAggregates(_df_long))
+
+
+@st.cache_resource(max_entries=2)
+def get_outlook(version, _df_long):
+    # Projections of every series to its Target Year, shared with the report builds
+    return get_forecasts(_df_long, version, data_changes(DATA_FILE))
+
+
+# Figures are cached per data version and filter key. cache_data hands every
+# rerun its own copy, so callers may restyle the figures they get back.
+@st.cache_data(max_entries=128)
+def indicator_figure(version, indicator, year_range):
+    indicator_df = index.rows('Indicator', indicator)
+    filtered_df = indicator_df[indicator_df['Year'].between(year_range[0], year_range[1])]
+
+    # Target achievement of every subcategory, evaluated in one grouped pass
+    targets = evaluate_targets(filtered_df, 'positive')
+
+    # Initial line chart for the selected indicator
+    fig, note = line_figure(filtered_df, 'Year', 'Value', color='Sub Category',
+                            title=f'Progress of {indicator} Towards Target', markers=True)
+
+    # Add target values for each subcategory as horizontal lines (dashed, purple)
+    for target_value, target_year in zip(targets['Target Value'], targets['Target Year']):
+        fig.add_hline(y=target_value, line_color="purple",
+                      annotation_text=f"Target: {target_value} by {target_year}",
+                      annotation_position="bottom right")
+    return fig, note, targets
+
+
+@st.cache_data(max_entries=128)
+def group_figure(version, column, value, title):
+    # Every indicator of one sub category or department
+    fig, note = line_figure(index.rows(column, value), 'Year', 'Value', color='Indicator', title=title)
+    fig.update_layout(
+        xaxis_title='Year (Units)',  # Update with the appropriate units
+        yaxis_title='Value (Units)'  # Update with the appropriate units
+    )
+    return fig, note
+
+
+@st.cache_data(max_entries=2)
+def summary_figures(version):
+    # The Yearly Progress, Target Achievement and Goal Distribution tabs only depend on the data version
+    figures = {
+        'yearly_summary': px.line(aggregates.yearly_summary, x='Year', y='Value',
+                                  title='Average Progress of All Indicators Over Years'),
+        'target_achievers': px.bar(aggregates.target_achievers, x='Indicator', y='Progress', color='Year',
+                                   title='Indicators Achieving Target'),
+        'goal_distribution': px.pie(aggregates.goal_counts, values='Percentage', names='Goal',
+                                    title='Distribution of Indicators Across Goals'),
+    }
+    for fig in figures.values():
+        fig.update_layout(
+            xaxis_title='Year (Units)',  # Update with the appropriate units
+            yaxis_title='Value (Units)'  # Update with the appropriate units
+        )
+    return figures
+
+
+@st.cache_data(max_entries=128)
+def goal_indicator_figures(version, goal_num, indicator, year_range):
+    indicator_df = index.select({'Goal': goal_num, 'Indicator': indicator})
+    filtered_df = indicator_df[indicator_df['Year'].between(year_range[0], year_range[1])]
+
+    fig, note = line_figure(filtered_df, 'Year', 'Value', color='Sub Category',
+                            title=f'Progress of {indicator} Towards Target', markers=True)
+    fig.update_layout(
+        xaxis_title='Year (Units)',  # Update with the appropriate units
+        yaxis_title='Value (Units)'  # Update with the appropriate units
+    )
+
+    target_value = filtered_df['Target Value'].iloc[0]
+    target_year = filtered_df['Target Year'].iloc[0]
+
+    if str(target_value)!='nan':
+        fig.add_hline(y=target_value,line_color="purple",
+                  annotation_text=f"Target Value: {target_value} by {target_year}",
+                  annotation_position="bottom right")
+
+    # The trendline is fitted on the whole indicator, not just the selected years
+    return fig, note, generate_trendline_plot(indicator_df)
+
+
+# Timing spans of this rerun, shown by the debug panel
+tracer = Tracer()
 
 # Load data
-df_long, indicators = load_data('allgoals.xlsx')
+with use_tracer(tracer):
+    with span('load_data'):
+        df_long, indicators = load_data(DATA_FILE)
+        version = data_version(DATA_FILE)
+    with span('aggregate'):
+        index = get_index(version, df_long)
+        aggregates = get_aggregates(version, df_long)
+        forecasts = get_outlook(version, df_long)
+
+
+def show_table(table, view):
+    # Only one page of the table is serialized to the browser per rerun
+    pages = page_count(len(table))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1, step=1,
+                               key=f'table_page_{view}')
+    st.dataframe(table_page(table, page))
+    if pages > 1:
+        st.caption(f"{len(table)} rows, {PAGE_SIZE} per page")
+
+
+def show_chart(fig, table, view, note=None):
+    # Serialize the figure and its table to the browser, timed as one span
+    with span('render', view=view):
+        st.plotly_chart(fig)
+        if note:
+            st.caption(note)
+        show_table(table, view)
+
+
+def debug_panel():
+    # Optional sidebar with the timings of this rerun and of the last report build
+    if not st.sidebar.checkbox('Show timings', key='debug_timings'):
+        return
+    st.sidebar.subheader('Timings (ms)')
+    st.sidebar.dataframe(pd.DataFrame(tracer.summary()).round(1))
+    st.sidebar.download_button('Chrome trace', tracer.to_chrome_trace(), file_name='rerun_trace.json',
+                               mime='application/json')
+    st.sidebar.download_button('Structured log', tracer.to_json_lines(), file_name='rerun_spans.jsonl',
+                               mime='application/x-ndjson')
+
+    job = get_job(st.session_state.get('report_job'))
+    if job is not None and job.tracer.spans:
+        st.sidebar.subheader('Report build (ms)')
+        st.sidebar.dataframe(pd.DataFrame(job.tracer.summary()).round(1))
+        st.sidebar.download_button('Report trace', job.tracer.to_chrome_trace(), file_name='report_trace.json',
+                                   mime='application/json')
+
+
+@st.fragment(run_every=1)
+def report_progress(job_id):
+    # Reruns by itself every second while the report builds, without rerunning the page
+    job = get_job(job_id)
+    if job is None or job.future.done():
+        st.rerun()  # The full rerun shows the download button or the error
+    st.progress(job.fraction)
+    st.caption(f"Generating report: {job.done} of {job.total or '?'} charts rendered")
+
+
+def report_status():
+    # Show the background report build of this session, if any
+    job = get_job(st.session_state.get('report_job'))
+    if job is None:
+        return
+
+    if not job.future.done():
+        report_progress(job.id)
+    elif job.future.exception() is not None:
+        st.error(f"Report generation failed: {job.future.exception()}")
+        discard_job(job.id)
+        del st.session_state['report_job']
+    else:
+        split = job.path.endswith('.zip')
+        with open(job.path, 'rb') as report_file:
+            st.download_button(
+                label="Download Report",
+                data=report_file,
+                file_name="final_report.zip" if split else "final_report.docx",
+                mime="application/zip" if split else
+                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
+
+
+def navigate(page, **params):
+    # Page state lives in the URL, so any server process can serve the next request
+    st.query_params.from_dict({'page': page, **{key: str(value) for key, value in params.items()}})
+    st.rerun()
 
 
 def main_page():
@@ -13,46 +208,34 @@ def main_page():
     st.sidebar.header('Filter')
 
     # Sidebar filters
-    indicator = st.sidebar.selectbox('Select Indicator', df_long['Indicator'].unique())
+    indicator = st.sidebar.selectbox('Select Indicator', index.values('Indicator'))
     year_range = st.sidebar.slider('Select Year Range', min_value=int(df_long['Year'].min()), max_value=int(df_long['Year'].max()), value=(2015, 2021))
 
     if st.sidebar.button('All Goals'):
-        st.session_state['page'] = 'goals_page'
-        st.experimental_rerun()
+        navigate('goals_page')
+
+    # Optional report scope; only the charts of the selected goals and departments are rendered
+    with st.sidebar.expander('Report scope'):
+        report_goals = st.multiselect('Goals', index.values('Goal'), key='report_goals')
+        report_departments = st.multiselect('Departments', index.values('Department'), key='report_departments')
+        report_split = st.checkbox('One document per goal (ZIP)', key='report_split')
 
     if st.button('Generate Report'):
-        docx_buffer = generate_docx_report(df_long, indicators)
-        st.download_button(
-            label="Download Report",
-            data=docx_buffer,
-            file_name="final_report.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
+        discard_job(st.session_state.get('report_job'))
+        st.session_state['report_job'] = submit_report(df_long, indicators, goals=report_goals or None,
+                                                       departments=report_departments or None,
+                                                       split=report_split, forecasts=forecasts)
+    report_status()
 
     # Filter data based on selections
-    filtered_df = df_long[(df_long['Indicator'] == indicator) & (df_long['Year'].between(year_range[0], year_range[1]))]
+    with span('filter', view='indicator'):
+        indicator_df = index.rows('Indicator', indicator)
+        filtered_df = indicator_df[indicator_df['Year'].between(year_range[0], year_range[1])]
 
     max_year = filtered_df['Year'].max()
 
-    # Initial line chart for the selected indicator
-    fig = px.line(filtered_df, x='Year', y='Value', title=f'Progress of {indicator} Towards Target', markers=True, color='Sub Category')
-
-    # Add target values for each subcategory as horizontal lines (dashed, purple)
-    for sub_category in filtered_df['Sub Category'].unique():
-        sub_category_df = filtered_df[filtered_df['Sub Category'] == sub_category]
-        if not sub_category_df.empty:
-            target_value = sub_category_df['Target Value'].iloc[0]
-            target_year = sub_category_df['Target Year'].iloc[0]
-            fig.add_hline(y=target_value, line_color="purple",
-                          annotation_text=f"Target: {target_value} by {target_year}",
-                          annotation_position="bottom right")
-        else:
-            if str(filtered_df['Target Value']) != 'nan':
-                target_value = filtered_df['Target Value'].iloc[0]
-                target_year = filtered_df['Target Year'].iloc[0]
-                fig.add_hline(y=target_value, line_color="purple",
-                              annotation_text=f"Target: {target_value} by {target_year}",
-                              annotation_position="bottom right")
+    with span('figure', view='indicator'):
+        fig, note, targets = indicator_figure(version, indicator, tuple(year_range))
     # Columns for buttons
     col1, col2, col3 = st.columns([1, 4, 1])
 
@@ -66,42 +249,19 @@ def main_page():
             with col1:
                 # Positive button
                 if st.button('Positive'):
-                    for sub_category in filtered_df['Sub Category'].unique():
-                        sub_category_df = filtered_df[filtered_df['Sub Category'] == sub_category]
-                        if not sub_category_df.empty:
-                            target_value_sub = sub_category_df['Target Value'].iloc[0]
-                            if any(sub_category_df['Value'] >= target_value_sub):
-                                fig.update_traces(patch={"line_color": "green"}, selector={"legendgroup": sub_category})
-                                positive_success_messages.append(
-                                    f"Indicator reached or exceeded the target value for Subcategory: {sub_category}")
-                        else:
-                            if str(filtered_df['Target Value']) != 'nan':
-                                target_value_sub = filtered_df['Target Value'].iloc[0]
-                                if any(filtered_df['Value'] >= target_value_sub):
-                                    fig.update_traces(patch={"line_color": "green"},
-                                                      selector={"legendgroup": sub_category})
-                                    positive_success_messages.append(
-                                        f"Indicator reached or exceeded the target value for Subcategory: {sub_category}")
+                    for sub_category in targets.loc[targets['Met'], 'Sub Category']:
+                        fig.update_traces(patch={"line_color": "green"}, selector={"legendgroup": sub_category})
+                        positive_success_messages.append(
+                            f"Indicator reached or exceeded the target value for Subcategory: {sub_category}")
 
             with col3:
                 # Negative button
                 if st.button('Negative'):
-                    for sub_category in filtered_df['Sub Category'].unique():
-                        sub_category_df = filtered_df[filtered_df['Sub Category'] == sub_category]
-                        if not sub_category_df.empty:
-                            target_value_sub = sub_category_df['Target Value'].iloc[0]
-                            if any(sub_category_df['Value'] <= target_value_sub):
-                                fig.update_traces(patch={"line_color": "green"}, selector={"legendgroup": sub_category})
-                                negative_success_messages.append(
-                                    f"Indicator reached or fell below the target value for Subcategory: {sub_category}")
-                        else:
-                            if str(filtered_df['Target Value']) != 'nan':
-                                target_value_sub = filtered_df['Target Value'].iloc[0]
-                                if any(filtered_df['Value'] <= target_value_sub):
-                                    fig.update_traces(patch={"line_color": "green"},
-                                                      selector={"legendgroup": sub_category})
-                                    positive_success_messages.append(
-                                        f"Indicator reached or exceeded the target value for Subcategory: {sub_category}")
+                    negative_targets = evaluate_targets(filtered_df, 'negative')
+                    for sub_category in negative_targets.loc[negative_targets['Met'], 'Sub Category']:
+                        fig.update_traces(patch={"line_color": "green"}, selector={"legendgroup": sub_category})
+                        negative_success_messages.append(
+                            f"Indicator reached or fell below the target value for Subcategory: {sub_category}")
 
             # Display success messages outside the columns
             for message in positive_success_messages:
@@ -109,131 +269,104 @@ def main_page():
             for message in negative_success_messages:
                 st.success(message)
 
-    st.plotly_chart(fig)
-    st.dataframe(filtered_df)
+    show_chart(fig, filtered_df, 'indicator', note)
 
-    # Extract the goal number from the Indicator Number
-    df_long['Goal'] = df_long['Indicator Number'].apply(lambda x: f"Goal {int(x.split('.')[0])}")
-
-    # Count the number of indicators for each goal
-    goal_counts = df_long['Goal'].value_counts().reset_index()
-    goal_counts.columns = ['Goal', 'Count']
-    goal_counts['Percentage'] = (goal_counts['Count'] / goal_counts['Count'].sum()) * 100
-
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(['Sub Category Analysis', 'Department-wise Performance', 'Yearly Progress Summary', 'Target Achievement Analysis', 'Goal Distribution'])
+    tab_names = ['Sub Category Analysis', 'Department-wise Performance', 'Yearly Progress Summary', 'Target Achievement Analysis', 'Goal Distribution']
+    # The outlook is only shown once target_directions.json gives some indicator a direction
+    show_outlook = has_directions(forecasts)
+    tabs = st.tabs(tab_names + ['Target Outlook'] if show_outlook else tab_names)
+    tab1, tab2, tab3, tab4, tab5 = tabs[:5]
 
     with tab1:
         st.header('Sub Category Analysis')
-        sub_category = st.selectbox('Select Sub Category', df_long['Sub Category'].dropna().unique(), key='sub_category_selectbox')
-        filtered_df = df_long[df_long['Sub Category'] == sub_category]
-        fig = px.line(filtered_df, x='Year', y='Value', color='Indicator', title=f'Progress of Indicators in Sub Category: {sub_category}')
-        fig.update_layout(
-            xaxis_title='Year (Units)',  # Update with the appropriate units
-            yaxis_title='Value (Units)'  # Update with the appropriate units
-        )
+        sub_category = st.selectbox('Select Sub Category', index.values('Sub Category'), key='sub_category_selectbox')
+        with span('filter', view='sub_category'):
+            filtered_df = index.rows('Sub Category', sub_category)
+        with span('figure', view='sub_category'):
+            fig, note = group_figure(version, 'Sub Category', sub_category,
+                                     f'Progress of Indicators in Sub Category: {sub_category}')
 
-        st.plotly_chart(fig)
-        st.dataframe(filtered_df)
+        show_chart(fig, filtered_df, 'sub_category', note)
 
     with tab2:
         st.header('Department-wise Performance')
-        department = st.selectbox('Select Department', df_long['Department'].unique(), key='department_selectbox')
-        filtered_df = df_long[df_long['Department'] == department]
-        fig = px.line(filtered_df, x='Year', y='Value', color='Indicator', title=f'Progress of Indicators under Department: {department}')
-        fig.update_layout(
-            xaxis_title='Year (Units)',  # Update with the appropriate units
-            yaxis_title='Value (Units)'  # Update with the appropriate units
-        )
+        department = st.selectbox('Select Department', index.values('Department'), key='department_selectbox')
+        with span('filter', view='department'):
+            filtered_df = index.rows('Department', department)
+        with span('figure', view='department'):
+            fig, note = group_figure(version, 'Department', department,
+                                     f'Progress of Indicators under Department: {department}')
 
-        st.plotly_chart(fig)
-        st.dataframe(filtered_df)
+        show_chart(fig, filtered_df, 'department', note)
+
+    with span('figure', view='summaries'):
+        figures = summary_figures(version)
 
     with tab3:
         st.header('Yearly Progress Summary')
-        summary_df = df_long.groupby('Year').agg({'Value': 'mean'}).reset_index()
-        fig = px.line(summary_df, x='Year', y='Value', title='Average Progress of All Indicators Over Years')
-        fig.update_layout(
-            xaxis_title='Year (Units)',  # Update with the appropriate units
-            yaxis_title='Value (Units)'  # Update with the appropriate units
-        )
-
-        st.plotly_chart(fig)
-        st.dataframe(summary_df)
+        show_chart(figures['yearly_summary'], aggregates.yearly_summary, 'yearly_summary')
 
     with tab4:
         st.header('Target Achievement Analysis')
-        df_long['Progress'] = (df_long['Value'] / df_long['Target Value']) * 100
-        target_achievers = df_long[df_long['Progress'] >= 100]
-        fig = px.bar(target_achievers, x='Indicator', y='Progress', color='Year', title='Indicators Achieving Target')
-        fig.update_layout(
-            xaxis_title='Year (Units)',  # Update with the appropriate units
-            yaxis_title='Value (Units)'  # Update with the appropriate units
-        )
-        st.plotly_chart(fig)
-        st.dataframe(target_achievers)
+        show_chart(figures['target_achievers'], aggregates.target_achievers, 'target_achievers')
 
     with tab5:
         st.header('Goal Distribution')
-        fig = px.pie(goal_counts, values='Percentage', names='Goal', title='Distribution of Indicators Across Goals')
-        fig.update_layout(
-            xaxis_title='Year (Units)',  # Update with the appropriate units
-            yaxis_title='Value (Units)'  # Update with the appropriate units
-        )
-        st.plotly_chart(fig)
-        st.dataframe(goal_counts)
+        show_chart(figures['goal_distribution'], aggregates.goal_counts, 'goal_distribution')
+
+    if show_outlook:
+        with tabs[5]:
+            st.header('Target Outlook')
+            st.caption('Every indicator and sub category projected to its Target Year along its linear trend, '
+                       'ranked from met to furthest off track. Indicators need a direction (increase or decrease) '
+                       'in target_directions.json to be assessed.')
+            status_counts = forecasts['Status'].value_counts(sort=False)
+            for column, (status, count) in zip(st.columns(len(status_counts)), status_counts.items()):
+                column.metric(status, int(count))
+            show_table(forecasts, 'outlook')
 
 
 def goals_page():
     st.title('Sustainable Development Goals')
     if st.button("Back"):
-        st.session_state['page'] = 'main_page'
-        st.experimental_rerun()
+        navigate('main_page')
     for i in range(1, 18):
         st.subheader(f'SDG {i}')
         if st.button(f'View SDG {i} Graph', key=f'view_sdg_{i}'):
-            st.session_state['page'] = 'goal_detail_page'
-            st.session_state['selected_goal'] = i
-            st.experimental_rerun()  # Force a rerun to update the page state immediately
+            navigate('goal_detail_page', goal=i)
 
 
 # Function to render the goal detail page with the graph
-def goal_detail_page():
-    goal_num = st.session_state['selected_goal']
+def goal_detail_page(goal_num):
     st.title(f'SDG {goal_num} Graph')
-    goal_df = df_long[df_long['Indicator Number'].str.startswith(f'{goal_num}.')]
+    with span('filter', view='goal'):
+        goal_df = index.rows('Goal', goal_num)
 
     if not goal_df.empty:
         indicator = st.selectbox('Select Indicator', goal_df['Indicator'].unique())
 
-        indicator_df = goal_df[goal_df['Indicator'] == indicator]  # Use the selected indicator
+        with span('filter', view='goal_indicator'):
+            indicator_df = index.select({'Goal': goal_num, 'Indicator': indicator})  # Use the selected indicator
 
         if not indicator_df.empty:
             year_range = st.slider('Select Year Range', min_value=int(indicator_df['Year'].min()),
                                    max_value=int(indicator_df['Year'].max()), value=(2015, 2021))
             filtered_df = indicator_df[indicator_df['Year'].between(year_range[0], year_range[1])]
 
-            fig = px.line(filtered_df, x='Year', y='Value', color='Sub Category',
-                          title=f'Progress of {indicator} Towards Target', markers=True)
-            fig.update_layout(
-                xaxis_title='Year (Units)',  # Update with the appropriate units
-                yaxis_title='Value (Units)'  # Update with the appropriate units
-            )
-
-            target_value = filtered_df['Target Value'].iloc[0]
-            target_year = filtered_df['Target Year'].iloc[0]
+            with span('figure', view='goal_indicator'):
+                fig, note, trendline_fig = goal_indicator_figures(version, goal_num, indicator, tuple(year_range))
 
-            if str(target_value)!='nan':
-                fig.add_hline(y=target_value,line_color="purple",
-                          annotation_text=f"Target Value: {target_value} by {target_year}",
-                          annotation_position="bottom right")
+            show_chart(fig, filtered_df, 'goal_indicator', note)
 
-            st.plotly_chart(fig)
-            st.dataframe(filtered_df)
+            # Display the trendline plot
+            if trendline_fig is not None:
+                with span('render', view='trendline'):
+                    st.plotly_chart(trendline_fig)
 
-            # Generate and display the trendline plot
-
-            trendline_fig = generate_trendline_plot(indicator_df)
-            st.plotly_chart(trendline_fig)
+            outlook = forecasts[(forecasts['Indicator'] == indicator) & (forecasts['Goal'] == goal_num)]
+            if has_directions(outlook):
+                st.subheader('Target Outlook')
+                st.dataframe(outlook)
 
         else:
             st.write("No data available for this indicator.")
@@ -241,20 +374,23 @@ def goal_detail_page():
         st.write("No data available for this goal.")
 
     if st.button('Back to Goals'):
-        st.session_state['page'] = 'goals_page'
-        st.experimental_rerun()  # Force a rerun to update the page state immediately
+        navigate('goals_page')
+
 
-# Initialize session state
-if 'page' not in st.session_state:
-    st.session_state['page'] = 'main_page'
-if 'selected_goal' not in st.session_state:
-    st.session_state['selected_goal'] = None
+# Page and goal come from the query params (?page=goal_detail_page&goal=3)
+page = st.query_params.get('page', 'main_page')
+goal = st.query_params.get('goal', '')
+if page == 'goal_detail_page' and not goal.isdigit():
+    page = 'goals_page'
 
 
 # Page navigation
-if st.session_state['page'] == 'main_page':
-    main_page()
-elif st.session_state['page'] == 'goals_page':
-    goals_page()
-elif st.session_state['page'] == 'goal_detail_page':
-    goal_detail_page()
+with use_tracer(tracer):
+    if page == 'goals_page':
+        goals_page()
+    elif page == 'goal_detail_page':
+        goal_detail_page(int(goal))
+    else:
+        main_page()
+
+debug_panel()
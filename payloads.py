@@ -0,0 +1,73 @@
+import math
+
+import pandas as pd
+import plotly.express as px
+
+# Tables are sent to the browser one page at a time
+PAGE_SIZE = 200
+
+# Level of detail for line charts: series and points beyond these are left out,
+# and charts with more than WEBGL_POINTS points are drawn with Scattergl
+MAX_TRACES = 25
+MAX_POINTS = 5000
+WEBGL_POINTS = 1000
+
+
+def page_count(n_rows, page_size=PAGE_SIZE):
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def table_page(df, page, page_size=PAGE_SIZE):
+    """Rows of the 1-based page of df, with page clamped to the valid range."""
+    page = min(max(1, int(page)), page_count(len(df), page_size))
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size]
+
+
+def _largest_series(df, color, max_traces):
+    # Keep the series with the most points, in their original order
+    sizes = df.groupby(color, sort=False, dropna=False, observed=True).size()
+    if len(sizes) <= max_traces:
+        return df, 0
+    keep = sizes.nlargest(max_traces, keep='first').index
+    return df[df[color].isin(keep)], len(sizes) - max_traces
+
+
+def _thin(df, color, max_points):
+    # Evenly spaced points of each series, always keeping its first and last point
+    if len(df) <= max_points:
+        return df
+    groups = df.groupby(color, sort=False, dropna=False, observed=True) if color else df.groupby(lambda _: 0)
+    position = groups.cumcount()
+    size = groups[df.columns[0]].transform('size')
+    per_series = max(2, max_points // max(1, groups.ngroups))
+    stride = -(-size // per_series)
+    return df[(position % stride == 0) | (position == size - 1)]
+
+
+def line_figure(df, x, y, color=None, max_traces=MAX_TRACES, max_points=MAX_POINTS, webgl_points=WEBGL_POINTS,
+                **kwargs):
+    """px.line with a level of detail, so large selections stay cheap to serialize.
+
+    At most max_traces series (the largest ones) and about max_points points are
+    plotted, and the traces switch to WebGL above webgl_points points.
+    Returns (figure, note), where note says what was left out or is None.
+    """
+    dropped = 0
+    if color is not None:
+        df, dropped = _largest_series(df, color, max_traces)
+        if isinstance(df[color].dtype, pd.CategoricalDtype):
+            # Index slices keep all of df_long's categories; only this chart's become traces
+            df = df.assign(**{color: df[color].cat.remove_unused_categories()})
+    rows = len(df)
+    df = _thin(df, color, max_points)
+
+    render_mode = 'webgl' if len(df) > webgl_points else 'svg'
+    fig = px.line(df, x=x, y=y, color=color, render_mode=render_mode, **kwargs)
+
+    notes = []
+    if dropped:
+        notes.append(f"showing the {max_traces} largest of {max_traces + dropped} series")
+    if len(df) < rows:
+        notes.append(f"{len(df)} of {rows} points plotted")
+    return fig, ('Chart simplified: ' + '; '.join(notes) + '.') if notes else None
@@ -1,11 +1,14 @@
 import plotly.express as px
 import numpy as np
+import pandas as pd
 import streamlit as st
 from plotly import graph_objs as go
-from sklearn.linear_model import LinearRegression
 
+from instrumentation import span
+from trendlines import fit_trendlines, forecast_trendlines
 
-def generate_trendline_plot(indicator_df):
+
+def generate_trendline_plot(indicator_df, confidence=None):
     # Drop rows with NaN values in 'Value' column
     indicator_df = indicator_df.dropna(subset=['Value'])
 
@@ -14,29 +17,38 @@ def generate_trendline_plot(indicator_df):
         st.warning("No valid data points available for trendline plot.")
         return None
 
-    # Create a Plotly figure
-    fig = px.line(indicator_df, x='Year', y='Value', color='Sub Category', title='Trendline by Subcategory')
-
-    # Fit a linear regression model and plot trendlines for each subcategory
-    for sub_category, data in indicator_df.groupby('Sub Category'):
-        X = data['Year'].values.reshape(-1, 1)
-        y = data['Value'].values.reshape(-1, 1)
-
-        model = LinearRegression()
-        model.fit(X, y)
-
-        # Predict values for the years 2021 to 2030
-        future_years = np.arange(2021, 2031).reshape(-1, 1)
-        predicted_values = model.predict(future_years)
-
-        # Add trendline to the plot
-        fig.add_trace(go.Scatter(x=future_years.flatten(), y=predicted_values.flatten(), mode='lines',
-                                 name=f'Trendline ({sub_category})'))
-
-    fig.update_layout(
-        xaxis_title='Year',  # Update with the appropriate units
-        yaxis_title='Value',  # Update with the appropriate units
-        legend_title='Sub Category'
-    )
+    with span('trendline_fit'):
+        # Fit one linear trend per subcategory in a single vectorized pass and
+        # predict values from the latest year up to the indicator's Target Year
+        fits = fit_trendlines(indicator_df)
+        target_years = indicator_df['Target Year'].dropna()
+        first_year = int(indicator_df['Year'].max())
+        last_year = max(int(target_years.max()) if not target_years.empty else 2030, first_year + 1)
+        forecast = forecast_trendlines(fits, np.arange(first_year, last_year + 1), confidence=confidence)
+
+    with span('figure', view='trendline'):
+        if isinstance(indicator_df['Sub Category'].dtype, pd.CategoricalDtype):
+            # Index slices keep all of df_long's sub categories; plot only this indicator's
+            indicator_df = indicator_df.assign(
+                **{'Sub Category': indicator_df['Sub Category'].cat.remove_unused_categories()})
+
+        # Create a Plotly figure
+        fig = px.line(indicator_df, x='Year', y='Value', color='Sub Category', title='Trendline by Subcategory')
+
+        # Add trendlines (and optional prediction bands) to the plot
+        for sub_category, data in forecast.groupby('Sub Category', sort=False, observed=True):
+            if confidence is not None and data['Lower'].notna().any():
+                fig.add_trace(go.Scatter(x=np.concatenate([data['Year'].to_numpy(), data['Year'].to_numpy()[::-1]]),
+                                         y=np.concatenate([data['Upper'].to_numpy(), data['Lower'].to_numpy()[::-1]]),
+                                         fill='toself', line_width=0, opacity=0.2, hoverinfo='skip',
+                                         name=f'{confidence:.0%} band ({sub_category})'))
+            fig.add_trace(go.Scatter(x=data['Year'], y=data['Value'], mode='lines',
+                                     name=f'Trendline ({sub_category})'))
+
+        fig.update_layout(
+            xaxis_title='Year',  # Update with the appropriate units
+            yaxis_title='Value',  # Update with the appropriate units
+            legend_title='Sub Category'
+        )
 
     return fig
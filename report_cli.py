@@ -0,0 +1,125 @@
+"""Build the SDG DOCX report from the command line, without a Streamlit runtime.
+
+Usage: python report_cli.py [--data allgoals.xlsx] [--output-dir .] [--workers N] [--per-goal] [--zip]
+                            [--goals 1,3] [--department NAME ...] [--forecasts outlook.csv]
+                            [--profile compact] [--compare-profiles] [--trace trace.json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from chart_cache import shared_cache
+from chart_renderer import DEFAULT_PROFILE, RENDER_PROFILES, compare_profiles, render_charts
+from data_loader import data_changes, data_version, load_data
+from docx_generator import (create_docx_report, create_goal_reports, get_cover_image, select_indicator_numbers,
+                            select_indicators, zip_reports)
+from forecasts import get_forecasts, scoped, status_counts
+from instrumentation import Tracer, span, use_tracer
+
+
+def _progress(done, total):
+    print(f"\rRendered {done}/{total} charts", end='' if done < total else '\n', file=sys.stderr)
+
+
+def _write(images_by_goal, cover_image, path, outlook=None):
+    # Spooled chart files are streamed straight into the DOCX on disk
+    create_docx_report(images_by_goal, cover_image, output=path, outlook=outlook)
+    print(f"Wrote {path}", file=sys.stderr)
+
+
+def _run(args):
+    start = time.perf_counter()
+    with span('load_data'):
+        df_long, indicators = load_data(args.data)
+    print(f"Loaded {len(indicators)} indicators in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    # Shared with the dashboard through the derived cache, so this is usually a lookup
+    with span('forecasts'):
+        forecasts = get_forecasts(df_long, data_version(args.data), data_changes(args.data))
+
+    if args.goals is not None or args.department is not None:
+        indicators = select_indicators(df_long, indicators, args.goals, args.department)
+        forecasts = scoped(forecasts, indicators, select_indicator_numbers(df_long, args.goals, args.department))
+        print(f"Reporting on {len(indicators)} selected indicators", file=sys.stderr)
+
+    if args.forecasts:
+        forecasts.to_csv(args.forecasts, index=False)
+        print(f"Wrote {args.forecasts}", file=sys.stderr)
+
+    if args.compare_profiles:
+        for result in compare_profiles(df_long, indicators):
+            print(f"{result['profile']:<8} {result['charts']} charts  {result['bytes'] / 1024:9.1f} KiB  "
+                  f"saved {result['bytes_saved'] / 1024:9.1f} KiB  {result['seconds']:6.2f}s")
+        return 0
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='sdg-report-') as spool_dir:
+        render_start = time.perf_counter()
+        with span('render_charts'):
+            images_by_goal = render_charts(df_long, indicators, max_workers=args.workers, progress=_progress,
+                                           cache=None if args.no_cache else shared_cache, spool_dir=spool_dir,
+                                           profile=args.profile)
+        chart_bytes = sum(os.path.getsize(path) for paths in images_by_goal.values() for path in paths)
+        print(f"Rendered charts in {time.perf_counter() - render_start:.2f}s "
+              f"({chart_bytes / 1024:.1f} KiB with the {args.profile} profile)", file=sys.stderr)
+
+        cover_image = get_cover_image()
+        outlook = status_counts(forecasts)
+        if not args.zip:
+            with span('create_docx_report'):
+                _write(images_by_goal, cover_image, os.path.join(args.output_dir, f'{args.output_name}.docx'),
+                       outlook)
+        if args.per_goal or args.zip:
+            # One document per goal, built in parallel; kept in the spool directory if only the ZIP is wanted
+            directory = args.output_dir if args.per_goal else spool_dir
+            with span('create_goal_reports', goals=len(images_by_goal)):
+                paths = create_goal_reports(images_by_goal, cover_image, directory, name=args.output_name,
+                                            max_workers=args.workers, outlook=outlook)
+            if args.per_goal:
+                for path in paths.values():
+                    print(f"Wrote {path}", file=sys.stderr)
+            if args.zip:
+                zip_path = os.path.join(args.output_dir, f'{args.output_name}.zip')
+                zip_reports(paths, zip_path)
+                print(f"Wrote {zip_path}", file=sys.stderr)
+
+    print(f"Done in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='allgoals.xlsx', help='workbook to report on')
+    parser.add_argument('--output-dir', default='.', help='directory for the generated reports')
+    parser.add_argument('--output-name', default='final_report', help='file name stem of the reports')
+    parser.add_argument('--workers', type=int, default=None, help='chart rendering processes (default: all cores)')
+    parser.add_argument('--per-goal', action='store_true', help='also write one report per goal')
+    parser.add_argument('--zip', action='store_true',
+                        help='write one report per goal bundled in a ZIP instead of a single report')
+    parser.add_argument('--goals', type=lambda value: [int(goal) for goal in value.split(',')],
+                        help='comma-separated goal numbers to report on (default: all)')
+    parser.add_argument('--department', action='append',
+                        help='department to report on; repeat for several (default: all)')
+    parser.add_argument('--no-cache', action='store_true', help='re-render every chart')
+    parser.add_argument('--profile', choices=sorted(RENDER_PROFILES), default=DEFAULT_PROFILE,
+                        help='chart size and encoding')
+    parser.add_argument('--compare-profiles', action='store_true',
+                        help='only compare the encoded size of a sample of charts under each profile')
+    parser.add_argument('--forecasts', help='also write the ranked target outlook of every series to this CSV')
+    parser.add_argument('--trace', help='write stage and per-chart timings to this Chrome trace file')
+    args = parser.parse_args(argv)
+
+    tracer = Tracer()
+    with use_tracer(tracer):
+        status = _run(args)
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            f.write(tracer.to_chrome_trace())
+        print(f"Wrote {args.trace}", file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from data_loader import CACHE_DIR
+from docx_generator import generate_docx_report
+from instrumentation import Tracer, use_tracer
+
+# Report builds run here, off the Streamlit script thread, so the session stays usable.
+# This module is imported once per server process, so jobs survive reruns.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='report')
+_jobs = {}
+_lock = threading.Lock()
+
+# Finished reports are written here instead of being kept in memory
+REPORT_DIR = os.path.join(CACHE_DIR, 'reports')
+
+# Finished jobs and their files are dropped after JOB_TTL seconds, or sooner
+# (oldest first) when more than MAX_FINISHED_JOBS are kept
+JOB_TTL = 60 * 60
+MAX_FINISHED_JOBS = 20
+
+
+class ReportJob:
+    def __init__(self, suffix='.docx'):
+        self.id = uuid.uuid4().hex
+        self.done = 0
+        self.total = 0
+        self.future = None
+        self.path = os.path.join(REPORT_DIR, f'{self.id}{suffix}')
+        self.created = time.time()
+        # Stage and per-chart timings of this build
+        self.tracer = Tracer()
+
+    def update(self, done, total):
+        self.done = done
+        self.total = total
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else 0.0
+
+
+def submit_report(df_long, indicators, **kwargs):
+    """Start building the DOCX report in the background and return the job id.
+
+    kwargs go to generate_docx_report; with split=True the job builds a ZIP of per-goal reports.
+    """
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    _expire()
+    _remove_orphans()
+    job = ReportJob('.zip' if kwargs.get('split') else '.docx')
+    job.future = _executor.submit(_build, job, df_long, indicators, **kwargs)
+    with _lock:
+        _jobs[job.id] = job
+    return job.id
+
+
+def _build(job, df_long, indicators, **kwargs):
+    with use_tracer(job.tracer):
+        return generate_docx_report(df_long, indicators, progress=job.update, output=job.path, **kwargs)
+
+
+def get_job(job_id):
+    _expire()
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def discard_job(job_id):
+    with _lock:
+        job = _jobs.pop(job_id, None)
+    if job is not None:
+        _discard(job)
+
+
+def _discard(job):
+    if job.future.done():
+        _remove(job.path)
+    elif not job.future.cancel():
+        # A running build cannot be cancelled; its file is removed once it finishes
+        job.future.add_done_callback(lambda _: _remove(job.path))
+
+
+def _expire():
+    # Drop finished jobs of sessions that never came back for their report
+    now = time.time()
+    with _lock:
+        finished = sorted((job for job in _jobs.values() if job.future.done()), key=lambda job: job.created)
+        expired = [job for job in finished if now - job.created > JOB_TTL]
+        expired += [job for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)] if job not in expired]
+        for job in expired:
+            del _jobs[job.id]
+    for job in expired:
+        _discard(job)
+
+
+def _remove_orphans():
+    # Files older than JOB_TTL that no job owns, e.g. left behind by a restarted server
+    with _lock:
+        owned = {job.path for job in _jobs.values()}
+    for name in os.listdir(REPORT_DIR):
+        path = os.path.join(REPORT_DIR, name)
+        try:
+            if path not in owned and time.time() - os.path.getmtime(path) > JOB_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,39 @@
+import pandas as pd
+
+TARGET_COLUMNS = ['Target Value', 'Target Year', 'Met', 'First Year Met', 'Latest Value', 'Gap']
+
+
+def evaluate_targets(df, direction='positive', group_cols=('Sub Category',)):
+    """Target achievement for every group of df in one grouped pass.
+
+    direction 'positive' means a value at or above the target meets it,
+    'negative' means at or below. Returns one row per group with its target,
+    whether any year met it, the first year that did, the latest value and
+    the gap still to close (negative once the latest value is past the target).
+    """
+    if direction not in ('positive', 'negative'):
+        raise ValueError(f"direction must be 'positive' or 'negative', not {direction!r}")
+    group_cols = list(group_cols)
+    keys = [df[column] for column in group_cols]
+
+    grouped = df.groupby(keys, sort=False, dropna=False, observed=True)
+    target = grouped['Target Value'].transform('first')
+    met = df['Value'] >= target if direction == 'positive' else df['Value'] <= target
+
+    has_value = df['Value'].notna()
+    latest = (df[has_value].sort_values('Year', kind='stable')
+              .groupby([key[has_value] for key in keys], sort=False, dropna=False, observed=True)['Value'].last())
+
+    result = pd.DataFrame({
+        'Target Value': grouped['Target Value'].first(),
+        'Target Year': grouped['Target Year'].first(),
+        'Met': met.groupby(keys, sort=False, dropna=False, observed=True).any(),
+        'First Year Met': (df['Year'].where(met).groupby(keys, sort=False, dropna=False, observed=True)
+                           .min().astype('Int64')),
+    })
+    result['Latest Value'] = latest.reindex(result.index)
+    if direction == 'positive':
+        result['Gap'] = result['Target Value'] - result['Latest Value']
+    else:
+        result['Gap'] = result['Latest Value'] - result['Target Value']
+    return result.reset_index()
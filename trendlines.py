@@ -0,0 +1,88 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy import stats
+except ImportError:  # scipy is optional; bands fall back to the normal approximation
+    stats = None
+
+
+def fit_trendlines(df, group_col='Sub Category', x_col='Year', y_col='Value'):
+    """Least-squares line per group, computed for all groups at once.
+
+    Rows with a missing x, y or group are ignored. Groups with a single point
+    (or a single distinct x) get a flat line through their mean, like
+    LinearRegression does. Returns one row per group, sorted by group, with
+    n, slope, intercept and the sums needed for confidence bands.
+    """
+    data = df[[group_col, x_col, y_col]].dropna()
+    codes, groups = pd.factorize(data[group_col], sort=True)
+    x = data[x_col].to_numpy(dtype=np.float64)
+    y = data[y_col].to_numpy(dtype=np.float64)
+    size = len(groups)
+
+    n = np.bincount(codes, minlength=size).astype(np.float64)
+    x_mean = np.bincount(codes, weights=x, minlength=size) / n
+    y_mean = np.bincount(codes, weights=y, minlength=size) / n
+    dx = x - x_mean[codes]
+    dy = y - y_mean[codes]
+    sxx = np.bincount(codes, weights=dx * dx, minlength=size)
+    sxy = np.bincount(codes, weights=dx * dy, minlength=size)
+
+    slope = np.divide(sxy, sxx, out=np.zeros(size), where=sxx > 0)
+    intercept = y_mean - slope * x_mean
+    residuals = dy - slope[codes] * dx
+    sse = np.bincount(codes, weights=residuals * residuals, minlength=size)
+
+    return pd.DataFrame({
+        group_col: groups,
+        'n': n.astype(np.int64),
+        'slope': slope,
+        'intercept': intercept,
+        'x_mean': x_mean,
+        'sxx': sxx,
+        'sse': sse,
+    })
+
+
+def _critical_value(confidence, dof):
+    if stats is not None:
+        return stats.t.ppf(0.5 + confidence / 2, dof)
+    return np.full(len(dof), NormalDist().inv_cdf(0.5 + confidence / 2))
+
+
+def forecast_trendlines(fits, years, confidence=None, group_col='Sub Category'):
+    """Tidy forecast table (group, Year, Value) for every fitted group and year.
+
+    With a confidence level such as 0.95, Lower/Upper prediction bounds are
+    added; they are NaN for groups with fewer than three points.
+    """
+    years = np.asarray(years, dtype=np.float64)
+    group_count, year_count = len(fits), len(years)
+    rows = np.repeat(np.arange(group_count), year_count)
+    x = np.tile(years, group_count)
+
+    slope = fits['slope'].to_numpy()[rows]
+    intercept = fits['intercept'].to_numpy()[rows]
+    forecast = pd.DataFrame({
+        group_col: fits[group_col].to_numpy()[rows],
+        'Year': x.astype(np.int64),
+        'Value': intercept + slope * x,
+    })
+
+    if confidence is not None:
+        n = fits['n'].to_numpy(dtype=np.float64)
+        dof = n - 2
+        valid = (dof > 0) & (fits['sxx'].to_numpy() > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            s = np.sqrt(fits['sse'].to_numpy() / dof)
+            critical = _critical_value(confidence, np.where(valid, dof, 1))
+            se = s[rows] * np.sqrt(1 + 1 / n[rows] + (x - fits['x_mean'].to_numpy()[rows]) ** 2
+                                   / fits['sxx'].to_numpy()[rows])
+        margin = np.where(valid[rows], critical[rows] * se, np.nan)
+        forecast['Lower'] = forecast['Value'] - margin
+        forecast['Upper'] = forecast['Value'] + margin
+
+    return forecast